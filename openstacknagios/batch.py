@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# pylint: disable=missing-docstring
+
+#
+#    Copyright (C) 2024  HPI  https://hpi.de
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Run many checks in one process and emit passive check results
+
+Checks sharing the same cloud region configuration share one
+authenticated connection. Results are written as external commands
+(e.g. to the Nagios/Icinga command pipe) or as JSON payloads for the
+Icinga2 API endpoint /v1/actions/process-check-result.
+
+Check specs are read from a JSON or YAML file, a list of objects like:
+
+    - host: region1
+      service: nova-services
+      check: nova_services
+      args: ["--os-cloud", "region1", "--binary", "nova-compute"]
+
+or from a text file with one check per line (shell quoting applies):
+
+    HOST SERVICE CHECK [CHECK OPTIONS...]
+"""
+
+import io
+import json
+import logging
+import shlex
+import sys
+import time
+from argparse import ArgumentParser
+from contextlib import redirect_stderr
+from typing import Any
+
+import yaml
+from nagiosplugin import Timeout
+from nagiosplugin.output import Output
+from nagiosplugin.platform import with_timeout
+
+import openstacknagios.openstacknagios as osnag
+from openstacknagios import checks
+
+_log = logging.getLogger("nagiosplugin")
+
+
+def load_specs(path: str) -> list[dict[str, Any]]:
+    """
+    Load check specs from `path`. Specs without a host and service to
+    report a result for are skipped with a warning, other errors are
+    reported as UNKNOWN result of the spec.
+    """
+    if path == "-":
+        content = sys.stdin.read()
+    else:
+        with open(path, "r", encoding="utf-8") as infile:
+            content = infile.read()
+
+    if path.endswith(".json"):
+        entries = json.loads(content)
+    elif path.endswith((".yaml", ".yml")):
+        entries = yaml.safe_load(content) or []
+    else:
+        entries = parse_text_specs(content, path)
+
+    if not isinstance(entries, list):
+        raise ValueError(f"{path}: expected a list of check specs")
+
+    specs = []
+    for number, spec in enumerate(entries, 1):
+        if not isinstance(spec, dict):
+            _log.warning("Skipping check spec %d of %s: not an object", number, path)
+            continue
+
+        missing = [
+            key
+            for key in ("host", "service")
+            if not isinstance(spec.get(key), str) or not spec[key]
+        ]
+        if missing:
+            _log.warning(
+                "Skipping check spec %d of %s: missing %s",
+                number,
+                path,
+                " and ".join(missing),
+            )
+            continue
+
+        specs.append(spec)
+
+    return specs
+
+
+def parse_text_specs(content: str, path: str) -> list[dict[str, Any]]:
+    """
+    Parse one `HOST SERVICE CHECK [CHECK OPTIONS...]` spec per line.
+    Malformed lines are skipped with a warning.
+    """
+    specs = []
+    for number, line in enumerate(content.splitlines(), 1):
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+
+        try:
+            fields = shlex.split(line)
+        except ValueError as err:
+            _log.warning("Skipping line %d of %s: %s", number, path, err)
+            continue
+
+        if len(fields) < 3:
+            _log.warning(
+                "Skipping line %d of %s: expected HOST SERVICE CHECK [OPTIONS...]",
+                number,
+                path,
+            )
+            continue
+
+        host, service, check, *args = fields
+        specs.append({"host": host, "service": service, "check": check, "args": args})
+
+    return specs
+
+
+def run_spec(spec: dict[str, Any]) -> dict[str, Any]:
+    """
+    Execute a single check spec and return a result dict with the exit
+    code, status line, long output and perfdata.
+    """
+    result = {
+        "host": spec["host"],
+        "service": spec["service"],
+        "exitcode": 3,
+        "status": "",
+        "output": [],
+        "perfdata": [],
+    }
+
+    args = spec.get("args") or []
+    try:
+        if isinstance(args, str):
+            args = shlex.split(args)
+        elif not isinstance(args, list):
+            raise ValueError("expected a list or string")
+        args = [str(arg) for arg in args]
+    except ValueError as err:
+        result["status"] = f"UNKNOWN: Invalid args: {err}"
+        return result
+
+    # Collect log messages of this check only, like nagiosplugin does
+    # for a regular check run.
+    logchan = logging.StreamHandler(io.StringIO())
+    logchan.setFormatter(logging.Formatter("%(message)s"))
+    logchan.setLevel(logging.WARNING)
+    logger = logging.getLogger("nagiosplugin")
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(logchan)
+
+    try:
+        if not spec.get("check"):
+            result["status"] = "UNKNOWN: Missing check"
+            return result
+
+        try:
+            resource_class = checks.load(str(spec["check"]))
+        except KeyError as err:
+            result["status"] = f"UNKNOWN: {err.args[0]}"
+            return result
+
+        stderr = io.StringIO()
+        try:
+            with redirect_stderr(stderr):
+                check, options = osnag.create_check(resource_class, args)
+        except SystemExit:
+            error = stderr.getvalue().strip().splitlines() or ["invalid arguments"]
+            result["status"] = f"UNKNOWN: {error[-1]}"
+            return result
+
+        try:
+            with_timeout(options.check_timeout, check)
+        except Timeout as exc:
+            result["status"] = f"UNKNOWN: Timeout: check execution aborted after {exc}"
+            return result
+
+        output = Output(logchan)
+        result["exitcode"] = check.exitcode
+        result["status"] = output.format_status(check)
+        result["perfdata"] = check.perfdata
+    except Exception as exc:  # pylint: disable=broad-exception-caught
+        result["status"] = f"UNKNOWN: {type(exc).__name__}: {exc}"
+    finally:
+        logger.removeHandler(logchan)
+        result["output"] = logchan.stream.getvalue().strip().splitlines()
+
+    return result
+
+
+def format_external_command(result: dict[str, Any]) -> str:
+    output = result["status"]
+    if result["perfdata"]:
+        output += " | " + " ".join(result["perfdata"])
+    if result["output"]:
+        output += "\\n" + "\\n".join(result["output"])
+
+    return "[{}] PROCESS_SERVICE_CHECK_RESULT;{};{};{};{}".format(
+        int(time.time()),
+        result["host"],
+        result["service"],
+        result["exitcode"],
+        output,
+    )
+
+
+def format_icinga2_api(result: dict[str, Any]) -> dict[str, Any]:
+    host = result["host"].replace('"', r"\"")
+    service = result["service"].replace('"', r"\"")
+
+    return {
+        "type": "Service",
+        "filter": f'host.name=="{host}" && service.name=="{service}"',
+        "exit_status": result["exitcode"],
+        "plugin_output": "\n".join([result["status"], *result["output"]]),
+        "performance_data": result["perfdata"],
+    }
+
+
+def main():
+    parser = ArgumentParser(
+        description=__doc__.strip().splitlines()[0],
+        epilog="Check specs are read from a JSON (.json), YAML (.yaml, .yml) or text file with one 'HOST SERVICE CHECK [OPTIONS...]' per line.",
+    )
+    parser.add_argument(
+        "specfile",
+        metavar="FILE",
+        help="file to read check specs from, use - for stdin (text format)",
+    )
+    parser.add_argument(
+        "--format",
+        choices=["external-command", "icinga2-api"],
+        default="external-command",
+        help="output format for check results (default: external-command)",
+    )
+    parser.add_argument(
+        "--output",
+        metavar="FILE",
+        default="-",
+        help="file or command pipe to append results to (default: - for stdout)",
+    )
+    args = parser.parse_args()
+
+    results = [run_spec(spec) for spec in load_specs(args.specfile)]
+
+    if args.format == "icinga2-api":
+        content = json.dumps([format_icinga2_api(r) for r in results], indent=2)
+    else:
+        content = "\n".join(format_external_command(r) for r in results)
+
+    if args.output == "-":
+        print(content)
+    else:
+        with open(args.output, "a", encoding="utf-8") as outfile:
+            print(content, file=outfile)
+
+
+if __name__ == "__main__":
+    main()
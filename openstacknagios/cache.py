@@ -0,0 +1,247 @@
+# pylint: disable=missing-docstring
+
+#
+#    Copyright (C) 2024  HPI  https://hpi.de
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Local state shared between check invocations
+
+Every check runs in its own short-lived process. The helpers in this
+module persist data in a private per-user runtime directory, so that
+subsequent invocations can reuse it instead of asking the cloud again.
+"""
+
+import contextlib
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import IO, TYPE_CHECKING, Iterator, Optional
+
+if TYPE_CHECKING:
+    from keystoneauth1.plugin import BaseAuthPlugin
+
+_log = logging.getLogger("nagiosplugin")
+
+# Tokens are not reused when they expire within this many seconds.
+TOKEN_EXPIRY_MARGIN = 300
+
+# Seconds between attempts to acquire a lock with a timeout.
+LOCK_POLL_INTERVAL = 0.01
+
+
+def runtime_dir(path: Optional[str] = None) -> str:
+    """
+    Return (and create) the private directory used for local state.
+
+    Defaults to a directory below `$XDG_RUNTIME_DIR`, or below the
+    system temp directory if no runtime directory is available. The
+    directory must be owned by the current user and must not be
+    accessible by anyone else.
+    """
+    if path is None:
+        base = os.environ.get("XDG_RUNTIME_DIR")
+        if base and os.path.isdir(base):
+            path = os.path.join(base, "openstacknagios")
+        else:
+            path = os.path.join(tempfile.gettempdir(), f"openstacknagios-{os.getuid()}")
+
+    os.makedirs(path, mode=0o700, exist_ok=True)
+
+    stat = os.stat(path)
+    if stat.st_uid != os.getuid():
+        raise PermissionError(f"{path} is not owned by the current user")
+    if stat.st_mode & 0o077:
+        raise PermissionError(f"{path} is accessible by other users")
+
+    return path
+
+
+@contextlib.contextmanager
+def locked_file(path: str, timeout: Optional[float] = None) -> Iterator[IO[str]]:
+    """
+    Open (or create) `path` readable only by the current user and hold
+    an exclusive lock on it until the context is left.
+
+    If `timeout` is given, raise `TimeoutError` if the lock cannot be
+    acquired within `timeout` seconds.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    with os.fdopen(fd, "r+", encoding="utf-8") as fp:
+        if timeout is None:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+        else:
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    fcntl.flock(fp, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError as err:
+                    if time.monotonic() >= deadline:
+                        raise TimeoutError(f"Cannot lock {path}") from err
+                    time.sleep(LOCK_POLL_INTERVAL)
+        yield fp
+
+
+def cache_key(*parts: str) -> str:
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def load_snapshot(
+    key: str, ttl: float, directory: Optional[str] = None, prefix: str = "snapshot"
+) -> Optional[dict]:
+    """
+    Return the snapshot stored under `key` if it is at most `ttl`
+    seconds old. Snapshots hold a "time" along with arbitrary JSON data.
+    """
+    path = os.path.join(runtime_dir(directory), f"{prefix}-{key}.json")
+
+    try:
+        with open(path, "r", encoding="utf-8") as infile:
+            snapshot = json.load(infile)
+    except FileNotFoundError:
+        return None
+
+    if time.time() - snapshot["time"] > ttl:
+        return None
+
+    return snapshot
+
+
+def snapshot_lock(
+    key: str, directory: Optional[str] = None, prefix: str = "snapshot"
+) -> contextlib.AbstractContextManager:
+    """
+    Return a context holding an exclusive lock for the snapshot stored
+    under `key`, so only one process at a time refreshes it.
+    """
+    return locked_file(os.path.join(runtime_dir(directory), f"{prefix}-{key}.lock"))
+
+
+def store_snapshot(
+    key: str, snapshot: dict, directory: Optional[str] = None, prefix: str = "snapshot"
+) -> None:
+    """
+    Store `snapshot` under `key`. The file is replaced atomically, so
+    concurrent readers see either the previous or the new snapshot.
+    """
+    directory = runtime_dir(directory)
+    fd, tmp = tempfile.mkstemp(prefix=f"{prefix}-", suffix=".tmp", dir=directory)
+
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as outfile:
+            json.dump(snapshot, outfile)
+        os.replace(tmp, os.path.join(directory, f"{prefix}-{key}.json"))
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class TokenCache:
+    """
+    Keystone token cache shared across check invocations.
+
+    The authentication state of the keystoneauth plugin is stored in a
+    locked file keyed by the plugin's cache id, which is derived from
+    all auth parameters (auth URL, credentials, scope). Concurrent checks
+    with the same credentials wait for the lock, so only one of them
+    authenticates when no usable token is cached.
+
+        with TokenCache(region.get_auth()):
+            connection.authorize()
+    """
+
+    def __init__(
+        self,
+        auth: Optional["BaseAuthPlugin"],
+        directory: Optional[str] = None,
+        margin: int = TOKEN_EXPIRY_MARGIN,
+    ) -> None:
+        self.auth = auth
+        self.directory = directory
+        self.margin = margin
+        self._stack = contextlib.ExitStack()
+        self._file: Optional[IO[str]] = None
+        self._state: Optional[str] = None
+
+    @property
+    def cache_id(self) -> Optional[str]:
+        if self.auth is None or not hasattr(self.auth, "get_auth_state"):
+            return None
+        return self.auth.get_cache_id()
+
+    def __enter__(self) -> "TokenCache":
+        cache_id = self.cache_id
+        if cache_id is None:
+            return self
+
+        try:
+            path = os.path.join(
+                runtime_dir(self.directory), f"token-{cache_key(cache_id)}.json"
+            )
+            self._file = self._stack.enter_context(locked_file(path))
+            self._load()
+        except (OSError, ValueError, KeyError) as err:
+            _log.warning("Token cache unavailable: %s", err)
+            self._stack.close()
+            self._file = None
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        try:
+            if exc_type is None and self._file is not None:
+                self._store()
+        except OSError as err:
+            _log.warning("Cannot update token cache: %s", err)
+        finally:
+            self._stack.close()
+            self._file = None
+
+    def _load(self) -> None:
+        assert self._file is not None
+
+        content = self._file.read()
+        if not content:
+            return
+
+        state = json.loads(content)["state"]
+        self.auth.set_auth_state(state)
+
+        auth_ref = self.auth.auth_ref
+        if auth_ref is None or auth_ref.will_expire_soon(self.margin):
+            _log.debug("Cached token expires soon, re-authenticating")
+            self.auth.set_auth_state(None)
+            return
+
+        _log.debug("Reusing cached token")
+        self._state = state
+
+    def _store(self) -> None:
+        assert self._file is not None
+
+        state = self.auth.get_auth_state()
+        if state is None or state == self._state:
+            return
+
+        self._file.seek(0)
+        self._file.truncate()
+        json.dump({"state": state}, self._file)
+        self._file.flush()
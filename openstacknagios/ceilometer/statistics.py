@@ -26,31 +26,44 @@ Returns the statistic of the chosen meter. This also returns the age of
 the last sample used to aggregate. So this check can also be used to
 verify freshness of samples in the ceilometer DB. (or of course to check
 the value).
+
+The statistics are requested as a single period covering the time frame,
+aggregated by ceilometer. Several meters can be checked in one run, they
+are queried concurrently.
 """
 
 import datetime
 from argparse import ArgumentParser, Namespace, _ArgumentGroup
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
 
-import ceilometerclient.v2.client as ceilclient
 from nagiosplugin.check import Check
 from nagiosplugin.context import ScalarContext
 from nagiosplugin.metric import Metric
-from openstack.config.cloud_region import CloudRegion
 from zoneinfo import ZoneInfo
 
 import openstacknagios.openstacknagios as osnag
 
+if TYPE_CHECKING:
+    from openstack.config.cloud_region import CloudRegion
+
 # Date format used by ceilometer for queries
 DATE_FORMAT = "%Y-%m-%dT%H:%M:%S"
 DATE_FORMAT_TZ = "%Y-%m-%dT%H:%M:%S %Z"
 
+# Number of meters queried at the same time.
+MAX_CONCURRENT_REQUESTS = 8
+
 
 class CeilometerStatistics(osnag.Resource):
-    def __init__(self, check: Check, args: Namespace, region: CloudRegion) -> None:
+    def __init__(self, check: Check, args: Namespace, region: "CloudRegion") -> None:
         super().__init__(check, args, region)
-        self.meter = args.meter
+        self.meters = args.meter
         self.tframe = datetime.timedelta(minutes=int(args.tframe))
-        self.tzone = ZoneInfo(args.tzone)
+        if args.tzone.upper() == "UTC":
+            self.tzone = datetime.timezone.utc
+        else:
+            self.tzone = ZoneInfo(args.tzone)
         self.verbose = args.verbose
         self.aggregate = args.aggregate
 
@@ -61,49 +74,81 @@ class CeilometerStatistics(osnag.Resource):
             ScalarContext("age", args.warn_age, args.critical_age),
             ScalarContext("count", args.warn_count, args.critical_count),
             ScalarContext("value", args.warn, args.critical),
-            osnag.Summary(show=["age", "count", "value"]),
+            osnag.Summary(
+                show=[
+                    f"{meter}_{name}" if len(args.meter) > 1 else name
+                    for meter in args.meter
+                    for name in ("age", "count", "value")
+                ]
+            ),
         )
 
     def probe(self):
+        import ceilometerclient.v2.client as ceilclient
+
         ceilometer = ceilclient.Client(session=self.session)
 
         now = datetime.datetime.now(self.tzone)
 
         tstart = now - self.tframe
-        query = []
-        query.append(
-            {"field": "timestamp", "op": "gt", "value": tstart.strftime(DATE_FORMAT)}
-        )
+        query = [
+            {"field": "timestamp", "op": "gt", "value": tstart.strftime(DATE_FORMAT)},
+            {"field": "timestamp", "op": "le", "value": now.strftime(DATE_FORMAT)},
+        ]
+        aggregates = [
+            {"func": func}
+            for func in dict.fromkeys(["count", self.aggregate, "min", "max"])
+        ]
+
+        def statistics(meter: str):
+            # A single period covering the whole time frame, so only one
+            # set of aggregates is returned.
+            return ceilometer.statistics.list(
+                meter,
+                q=query,
+                period=int(self.tframe.total_seconds()),
+                aggregates=aggregates,
+            )
 
-        teste = ceilometer.statistics.list(self.meter, q=query)
-        # print "meters = %s" % ceilometer.meters.list()
-        # print "resources = %s" % ceilometer.resources.list()
-        # print "alarms = %s" % ceilometer.alarms.list()
+        with ThreadPoolExecutor(MAX_CONCURRENT_REQUESTS) as executor:
+            results = list(executor.map(statistics, self.meters))
 
-        for t in teste:
-            period_end = self.tzone.localize(
-                datetime.datetime.strptime(
-                    getattr(t, "period_end", "")[:19], DATE_FORMAT
-                )
-            )
-            age = now - period_end
+        for meter, stats in zip(self.meters, results):
+            prefix = f"{meter}_" if len(self.meters) > 1 else ""
+
+            if not stats:
+                yield Metric(f"{prefix}count", 0, uom="samples", context="count")
+                continue
+
+            t = stats[0]
+            aggregate = getattr(t, "aggregate", None) or t.to_dict()
+
+            # duration_end is the timestamp of the newest sample, stored
+            # without timezone.
+            last = datetime.datetime.strptime(
+                getattr(t, "duration_end", "")[:19], DATE_FORMAT
+            ).replace(tzinfo=self.tzone)
+            age = now - last
 
             yield Metric(
-                "count",
-                getattr(t, "count", ""),
+                f"{prefix}count",
+                aggregate.get("count", ""),
                 uom="samples",
+                context="count",
             )
             yield Metric(
-                "age",
+                f"{prefix}age",
                 age.total_seconds() / 60,
                 uom="m",
+                context="age",
             )
             yield Metric(
-                "value",
-                getattr(t, self.aggregate, ""),
-                min=getattr(t, "min", ""),
-                max=getattr(t, "max", ""),
+                f"{prefix}value",
+                aggregate.get(self.aggregate, ""),
+                min=aggregate.get("min", ""),
+                max=aggregate.get("max", ""),
                 uom=getattr(t, "unit", ""),
+                context="value",
             )
 
     @classmethod
@@ -114,8 +159,9 @@ class CeilometerStatistics(osnag.Resource):
             "-m",
             "--meter",
             metavar="METER_NAME",
+            action="append",
             required=True,
-            help="meter name (required)",
+            help="meter name (required), can be given multiple times to check several meters at once",
         )
         options.add_argument(
             "-t",
@@ -128,7 +174,7 @@ class CeilometerStatistics(osnag.Resource):
         options.add_argument(
             "--tzone",
             metavar="TZONE",
-            default="utc",
+            default="UTC",
             help="Timezone to use. Ceilometer does not store any timezone information with the samples.",
         )
         options.add_argument(
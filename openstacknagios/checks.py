@@ -0,0 +1,70 @@
+# pylint: disable=missing-docstring
+
+#
+#    Copyright (C) 2024  HPI  https://hpi.de
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Registry of all available checks
+
+Maps the check names, as used for the `check_*` scripts, to the resource
+classes implementing them. This module must stay cheap to import.
+"""
+
+import importlib
+
+CHECKS = {
+    "ceilometer_statistics": "openstacknagios.ceilometer.statistics:CeilometerStatistics",
+    "cinder_services": "openstacknagios.cinder.services:CinderServices",
+    "glance_images": "openstacknagios.glance.images:GlanceImages",
+    "gnocchi_measures": "openstacknagios.gnocchi.measures:GnocchiMeasures",
+    "gnocchi_status": "openstacknagios.gnocchi.status:GnocchiStatus",
+    "keystone_status": "openstacknagios.keystone.status:KeystoneStatus",
+    "neutron_agents": "openstacknagios.neutron.agents:NeutronAgents",
+    "neutron_floatingips": "openstacknagios.neutron.floating_ips:NeutronFloatingIPs",
+    "neutron_network_ip_availability": "openstacknagios.neutron.network_ip_availability:NeutronNetworkIPAvailability",
+    "neutron_routers": "openstacknagios.neutron.routers:NeutronRouters",
+    "nova_aggregates": "openstacknagios.nova.aggregates:NovaAggregates",
+    "nova_hypervisors": "openstacknagios.nova.hypervisors:NovaHypervisors",
+    "nova_services": "openstacknagios.nova.services:NovaServices",
+    "panko_events": "openstacknagios.panko.events:PankoEvents",
+    "rally_results": "openstacknagios.rally.results:RallyResults",
+}
+
+
+def check_name(name: str) -> str:
+    """
+    Normalize a check or script name, e.g. `check_nova_services` or
+    `nova-services`, to the key used in `CHECKS`.
+    """
+    name = name.rsplit("/", 1)[-1].replace("-", "_")
+    if name.startswith("check_"):
+        name = name[len("check_") :]
+
+    if name not in CHECKS:
+        raise KeyError(f"Unknown check: {name}")
+
+    return name
+
+
+def load(name: str):
+    """Import and return the resource class for the check `name`."""
+    module, cls = CHECKS[check_name(name)].split(":")
+    return getattr(importlib.import_module(module), cls)
+
+
+def load_all():
+    return {name: load(name) for name in CHECKS}
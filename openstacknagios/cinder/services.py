@@ -26,22 +26,24 @@ This corresponds to the output of 'cinder service-list'.
 """
 
 from argparse import ArgumentParser, Namespace, _ArgumentGroup
+from typing import TYPE_CHECKING
 
-from cinderclient.client import Client
 from nagiosplugin.check import Check
 from nagiosplugin.context import ScalarContext
 from nagiosplugin.metric import Metric
-from openstack.config.cloud_region import CloudRegion
 
 import openstacknagios.openstacknagios as osnag
 
+if TYPE_CHECKING:
+    from openstack.config.cloud_region import CloudRegion
+
 
 class CinderServices(osnag.Resource):
     """
     Determines the status of the cinder agents/services.
     """
 
-    def __init__(self, check: Check, args: Namespace, region: CloudRegion) -> None:
+    def __init__(self, check: Check, args: Namespace, region: "CloudRegion") -> None:
         super().__init__(check, args, region)
         self.binary = args.binary
         self.host = args.host
@@ -54,36 +56,54 @@ class CinderServices(osnag.Resource):
             ScalarContext("disabled", args.warn_disabled, args.critical_disabled),
             ScalarContext("down", args.warn_down, args.critical_down),
             ScalarContext("total", "0:", "@0"),
+            ScalarContext("snapshot_age"),
             osnag.Summary(show=["up", "disabled", "down", "total"]),
         )
 
     def probe(self):
-        cinder = Client("3", session=self.session)
-        result = cinder.services.list()
-
-        services_up = 0
-        services_disabled = 0
-        services_down = 0
-        services_total = 0
-
-        for agent in result:
-            if (self.host is None or self.host == agent.host) and (
-                self.binary is None or self.binary == agent.binary
-            ):
-                services_total += 1
-                if agent.status == "enabled" and agent.state == "up":
-                    services_up += 1
-                elif agent.status == "disabled":
-                    services_disabled += 1
-                else:
-                    services_down += 1
-
-        return [
-            Metric("up", services_up, min=0),
-            Metric("disabled", services_disabled, min=0),
-            Metric("down", services_down, min=0),
-            Metric("total", services_total, min=0),
-        ]
+        from cinderclient.client import Client
+
+        def fetch(host=None):
+            cinder = Client("3", session=self.session)
+            result = cinder.services.list(host=host, binary=self.binary)
+            return [service.to_dict() for service in result]
+
+        metrics = []
+
+        # Filter by binary and a single host on the server side. The
+        # result is still filtered here, in case the API ignores them.
+        # With a snapshot, all services are shared with the checks of
+        # other hosts.
+        if self.args.snapshot_ttl:
+            result, age = self.snapshot(
+                f"volumev3 services {self.binary}", fetch, "host", self.host
+            )
+            metrics.append(Metric("snapshot_age", round(age, 1), uom="s", min=0))
+        elif self.host and len(self.host) == 1:
+            result = fetch(self.host[0])
+        else:
+            result = fetch()
+
+        metrics.extend(
+            osnag.service_metrics(
+                (
+                    (service["host"], self._state(service))
+                    for service in result
+                    if self.binary is None or self.binary == service["binary"]
+                ),
+                hosts=self.host,
+                per_host=self.args.per_host,
+            )
+        )
+        return metrics
+
+    @staticmethod
+    def _state(service) -> str:
+        if service["status"] == "enabled" and service["state"] == "up":
+            return "up"
+        if service["status"] == "disabled":
+            return "disabled"
+        return "down"
 
     @classmethod
     def setup(cls, options: _ArgumentGroup, parser: ArgumentParser):
@@ -136,9 +156,16 @@ class CinderServices(osnag.Resource):
         options.add_argument(
             "--host",
             dest="host",
+            action="append",
             default=None,
-            help="filter hostname",
+            help="filter hostname, can be given multiple times to check several hosts at once",
+        )
+        options.add_argument(
+            "--per-host",
+            action="store_true",
+            help="report metrics for each host in addition to the totals",
         )
+        osnag.snapshot_option(options)
 
 
 def main():
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# pylint: disable=missing-docstring
+
+#
+#    Copyright (C) 2024  HPI  https://hpi.de
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Lightweight client for the resident check daemon
+
+Usage:
+
+    check_openstack_client CHECK [CHECK OPTIONS...]
+
+e.g. `check_openstack_client nova_services --host compute1`. The client
+can also be installed as a symlink named like the check, e.g.
+`check_nova_services -> check_openstack_client`.
+
+The command line, environment and working directory are sent to
+`check_openstack_daemon` along with the standard input, which is passed
+as a file descriptor. The daemon executes the check and returns its
+output and exit code. When no daemon is running, the check is executed
+in-process instead.
+
+This module must only import from the standard library to keep the
+startup time of the client minimal.
+"""
+
+import json
+import os
+import socket
+import sys
+
+from openstacknagios import cache, checks
+
+# Seconds to wait for the daemon if the check does not specify
+# --check-timeout itself.
+DEFAULT_TIMEOUT = 10
+
+
+def socket_path() -> str:
+    return os.environ.get("OPENSTACKNAGIOS_SOCKET") or os.path.join(
+        cache.runtime_dir(), "daemon.sock"
+    )
+
+
+def check_timeout(argv: list[str]) -> int:
+    for i, arg in enumerate(argv):
+        if arg.startswith("--check-timeout="):
+            return int(arg.split("=", 1)[1])
+        if arg == "--check-timeout" and i + 1 < len(argv):
+            return int(argv[i + 1])
+    return DEFAULT_TIMEOUT
+
+
+def stdin_fds() -> list[int]:
+    try:
+        os.fstat(0)
+    except OSError:
+        # Standard input is closed.
+        return []
+    return [0]
+
+
+def request(path: str, name: str, argv: list[str]) -> tuple[int, str]:
+    payload = json.dumps(
+        {"check": name, "argv": argv, "env": dict(os.environ), "cwd": os.getcwd()}
+    )
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        # Leave the daemon some headroom to report its own timeout.
+        sock.settimeout(check_timeout(argv) + 5)
+        sock.connect(path)
+        # Pass our standard input, for checks reading their input there.
+        socket.send_fds(sock, [b"\0"], stdin_fds())
+        sock.sendall(payload.encode("utf-8"))
+        sock.shutdown(socket.SHUT_WR)
+
+        chunks = []
+        while chunk := sock.recv(65536):
+            chunks.append(chunk)
+
+    response = json.loads(b"".join(chunks))
+    return response["exitcode"], response["output"]
+
+
+def main():
+    argv = sys.argv[1:]
+
+    try:
+        name = checks.check_name(sys.argv[0])
+    except KeyError:
+        if not argv or argv[0] in ("-h", "--help"):
+            print(__doc__.strip())
+            sys.exit(3)
+        name, argv = argv[0], argv[1:]
+
+    try:
+        exitcode, output = request(socket_path(), name, argv)
+    except (FileNotFoundError, ConnectionRefusedError):
+        # No daemon running, execute the check ourselves.
+        sys.argv = [sys.argv[0], *argv]
+        try:
+            checks.load(name).run()
+        except KeyError as err:
+            print(f"UNKNOWN: {err.args[0]}")
+            sys.exit(3)
+        return
+    except (OSError, ValueError, KeyError) as err:
+        print(f"UNKNOWN: check daemon failed: {err}")
+        sys.exit(3)
+
+    sys.stdout.write(output)
+    sys.exit(exitcode)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+# pylint: disable=missing-docstring
+
+#
+#    Copyright (C) 2024  HPI  https://hpi.de
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Coalescing of identical API requests across check processes
+
+Checks scheduled at the same time often send the very same GET request,
+e.g. to list all routers. With a coalescing adapter mounted on the
+session, the first process takes a lock for the request and sends it.
+Other processes wait for the lock and reuse its response from a spool
+file in the runtime directory:
+
+    http.mount("https://", CoalescingAdapter(http.adapters["https://"], key, 5))
+
+Only successful responses are spooled, and reused for `window` seconds
+after they were received.
+"""
+
+import base64
+import contextlib
+import json
+import logging
+import os
+import re
+import time
+from typing import Optional
+from urllib.parse import unquote
+
+from requests.adapters import BaseAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from openstacknagios import cache
+
+_log = logging.getLogger("nagiosplugin")
+
+# Seconds to wait for another process sending the same request, before
+# sending it anyway.
+LOCK_TIMEOUT = 5
+
+# Request headers differing between processes without changing the
+# response. The credentials are part of the key instead.
+IGNORED_HEADERS = ("x-auth-token", "user-agent")
+
+# Request headers unique to a single request, e.g. the token validated
+# by check_keystone_status. Such requests are never coalesced.
+UNIQUE_HEADERS = ("x-subject-token",)
+
+# Queries bounded by the current time, e.g. of check_ceilometer_statistics,
+# are hardly ever sent again by another check. Such requests are never
+# coalesced either.
+TIMESTAMP = re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}")
+
+# Spool files not used for this many seconds, or the window if it is
+# longer, are removed.
+SPOOL_MAX_AGE = 60
+
+# Requests are locked by this many leading hex digits of their key, so
+# there are at most 16**2 lock files. They are never removed, which would
+# break the mutual exclusion of processes holding or waiting for a lock.
+# Different requests sharing a lock only wait for each other.
+LOCK_KEY_DIGITS = 2
+
+# Whether this process removed old spool files already.
+_pruned = False
+
+# Response headers describing the transfer rather than the spooled body.
+TRANSFER_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+
+
+class CoalescingAdapter(BaseAdapter):
+    """
+    Transport adapter sending GET requests through `adapter` only once
+    per `window` seconds across all processes using the same `key`,
+    which has to identify the cloud and credentials.
+    """
+
+    def __init__(
+        self,
+        adapter: BaseAdapter,
+        key: str,
+        window: float,
+        directory: Optional[str] = None,
+    ) -> None:
+        super().__init__()
+        self.adapter = adapter
+        self.key = key
+        self.window = window
+        self.directory = directory
+
+    def request_key(self, request) -> str:
+        headers = sorted(
+            (name.lower(), value)
+            for name, value in request.headers.items()
+            if name.lower() not in IGNORED_HEADERS
+        )
+        return cache.cache_key(
+            self.key, request.method, request.url, json.dumps(headers)
+        )
+
+    @staticmethod
+    def coalescable(request) -> bool:
+        if request.method != "GET":
+            return False
+        if any(name.lower() in UNIQUE_HEADERS for name in request.headers):
+            return False
+        return not TIMESTAMP.search(unquote(request.url))
+
+    def send(self, request, stream=False, **kwargs):
+        if stream or not self.coalescable(request):
+            return self.adapter.send(request, stream=stream, **kwargs)
+
+        key = self.request_key(request)
+
+        with contextlib.ExitStack() as stack:
+            try:
+                path = os.path.join(
+                    cache.runtime_dir(self.directory),
+                    f"flight-{key[:LOCK_KEY_DIGITS]}.lock",
+                )
+                stack.enter_context(cache.locked_file(path, LOCK_TIMEOUT))
+                spooled = cache.load_snapshot(
+                    key, self.window, self.directory, prefix="flight"
+                )
+            except (OSError, ValueError, KeyError) as err:
+                _log.warning("Not coalescing %s: %s", request.url, err)
+                return self.adapter.send(request, stream=stream, **kwargs)
+
+            if spooled is not None:
+                _log.debug("Reusing response to GET %s", request.url)
+                return self.build_response(request, spooled)
+
+            response = self.adapter.send(request, stream=stream, **kwargs)
+
+            if response.ok:
+                try:
+                    cache.store_snapshot(
+                        key, self.spool(response), self.directory, prefix="flight"
+                    )
+                except (OSError, TypeError) as err:
+                    _log.warning("Cannot spool response: %s", err)
+
+            self.prune()
+            return response
+
+    def prune(self) -> None:
+        """
+        Remove spool files of requests not sent recently, once per
+        process.
+        """
+        global _pruned  # pylint: disable=global-statement
+
+        if _pruned:
+            return
+        _pruned = True
+
+        expires = time.time() - max(self.window, SPOOL_MAX_AGE)
+
+        try:
+            entries = list(os.scandir(cache.runtime_dir(self.directory)))
+        except OSError as err:
+            _log.warning("Cannot prune spooled responses: %s", err)
+            return
+
+        for entry in entries:
+            # Spool files and temporary files left by a killed process
+            if not entry.name.startswith("flight-") or entry.name.endswith(".lock"):
+                continue
+
+            try:
+                if entry.stat().st_mtime < expires:
+                    os.unlink(entry.path)
+            except OSError:
+                # Removed by another process.
+                continue
+
+    @staticmethod
+    def spool(response: Response) -> dict:
+        return {
+            "time": time.time(),
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": {
+                name: value
+                for name, value in response.headers.items()
+                if name.lower() not in TRANSFER_HEADERS
+            },
+            "body": base64.b64encode(response.content).decode("ascii"),
+        }
+
+    def build_response(self, request, spooled: dict) -> Response:
+        response = Response()
+        response.status_code = spooled["status"]
+        response.reason = spooled["reason"]
+        response.headers = CaseInsensitiveDict(spooled["headers"])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response._content = base64.b64decode(  # pylint: disable=protected-access
+            spooled["body"]
+        )
+        return response
+
+    def close(self) -> None:
+        self.adapter.close()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# pylint: disable=missing-docstring
+
+#
+#    Copyright (C) 2024  HPI  https://hpi.de
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Resident check daemon
+
+Imports all checks and their client libraries once and then serves check
+requests from `check_openstack_client` on a Unix socket. Every request
+is executed in a forked child, so checks are isolated from each other
+but start with everything already imported. Keystone tokens are shared
+between the children through the token cache.
+"""
+
+import importlib
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+from argparse import ArgumentParser
+from contextlib import redirect_stderr, redirect_stdout
+
+from openstacknagios import checks
+from openstacknagios.client import socket_path
+
+# Modules imported by the daemon up front. Checks import their client
+# libraries lazily, so these are imported explicitly to make them
+# available to all forked children.
+PRELOAD = [
+    "ceilometerclient.v2.client",
+    "cinderclient.client",
+    "glanceclient.v2.client",
+    "gnocchiclient.v1.client",
+    "keystoneclient.v2_0.client",
+    "keystoneclient.v3.client",
+    "neutronclient.neutron.client",
+    "novaclient.client",
+    "openstack.config.loader",
+    "openstack.connection",
+    "pankoclient.v2.client",
+]
+
+
+def execute(name: str, argv: list[str]) -> tuple[int, str]:
+    """
+    Run the check `name` with the command line arguments `argv` in the
+    current process and return its exit code and output.
+    """
+    from openstacknagios.openstacknagios import run_check
+
+    output = io.StringIO()
+
+    try:
+        resource_class = checks.load(name)
+    except KeyError as err:
+        return 3, f"UNKNOWN: {err.args[0]}\n"
+
+    sys.argv = [f"check_{checks.check_name(name)}", *argv]
+
+    with redirect_stdout(output), redirect_stderr(output):
+        try:
+            run_check(resource_class)
+            exitcode = 0
+        except SystemExit as exc:
+            if exc.code is None or isinstance(exc.code, int):
+                exitcode = exc.code or 0
+            else:
+                print(exc.code, file=output)
+                exitcode = 3
+
+    return exitcode, output.getvalue()
+
+
+class CheckHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            # The client passes its standard input along with a single
+            # byte, ahead of the request.
+            _, fds, _, _ = socket.recv_fds(self.connection, 1, 1)
+            request = json.loads(self.rfile.read())
+
+            os.environ.clear()
+            os.environ.update(request.get("env", {}))
+
+            # Run the check like the client would, relative to its working
+            # directory and reading its standard input, never the daemon's.
+            if "cwd" in request:
+                os.chdir(request["cwd"])
+            stdin = fds[0] if fds else os.open(os.devnull, os.O_RDONLY)
+            os.dup2(stdin, 0)
+            os.close(stdin)
+            sys.stdin = open(0, "r", encoding="utf-8", closefd=False)
+
+            exitcode, output = execute(request["check"], request.get("argv", []))
+        except (ValueError, KeyError) as err:
+            exitcode, output = 3, f"UNKNOWN: Invalid request: {err}\n"
+        except OSError as err:
+            exitcode, output = 3, f"UNKNOWN: Cannot set up check: {err}\n"
+
+        self.wfile.write(
+            json.dumps({"exitcode": exitcode, "output": output}).encode("utf-8")
+        )
+
+
+class CheckServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    pass
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--socket",
+        metavar="PATH",
+        default=None,
+        help="Unix socket to listen on (default: daemon.sock in the runtime directory, or $OPENSTACKNAGIOS_SOCKET)",
+    )
+    parser.add_argument(
+        "--max-children",
+        type=int,
+        default=64,
+        help="Maximum number of checks executed concurrently (default: 64)",
+    )
+    args = parser.parse_args()
+
+    path = args.socket or socket_path()
+
+    # Import all checks, their client libraries and the OpenStack SDK
+    # up front. Forked children inherit the loaded modules.
+    checks.load_all()
+
+    for module in PRELOAD:
+        importlib.import_module(module)
+
+    if os.path.exists(path):
+        os.unlink(path)
+
+    old_umask = os.umask(0o077)
+    try:
+        server = CheckServer(path, CheckHandler)
+    finally:
+        os.umask(old_umask)
+
+    server.max_children = args.max_children
+
+    def terminate(_signum, _frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, terminate)
+
+    with server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
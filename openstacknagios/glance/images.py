@@ -22,18 +22,35 @@
 Nagios plugin to check running glance images
 
 This corresponds to the output of 'glance image-list'.
+
+Besides the total time, the time to obtain a token and the time spent
+in each phase of the HTTP requests (DNS lookup, TCP connect, TLS
+handshake, time to first byte and reading the body) are reported.
+
+With --inventory, the whole image list is walked page by page instead,
+and the images are counted by status and visibility along with their
+total size. If the check timeout is about to be reached, the walk stops
+early and the counts so far are reported.
 """
 
+import logging
 import time
 from argparse import ArgumentParser, Namespace, _ArgumentGroup
 
-from glanceclient.v2.client import Client
 from nagiosplugin.check import Check
 from nagiosplugin.context import ScalarContext
 from nagiosplugin.metric import Metric
 
 import openstacknagios.openstacknagios as osnag
 
+_log = logging.getLogger("nagiosplugin")
+
+# Image states and visibilities always reported in inventory mode, other
+# states are reported when they occur. Deleted images are only listed by
+# deployments keeping them visible.
+STATUSES = ("active", "queued", "saving", "killed", "deleted")
+VISIBILITIES = ("public", "private", "shared", "community")
+
 
 class GlanceImages(osnag.Resource):
     """
@@ -45,18 +62,95 @@ class GlanceImages(osnag.Resource):
 
         check.add(
             ScalarContext("gettime", args.warn, args.critical),
-            osnag.Summary(show=["gettime"]),
+            ScalarContext("phase"),
+            ScalarContext("images"),
+            ScalarContext("incomplete", "0"),
+            osnag.Summary(show=["gettime", "images"]),
         )
 
     def probe(self):
+        if self.args.inventory:
+            return self._inventory()
+
+        from glanceclient.v2.client import Client
+
+        from openstacknagios.timing import RequestTimer
+
+        start = time.time()
+
+        session = self.session
+        auth_time = time.time() - start
+
+        glance = Client("2", session=session)
+        with RequestTimer(session) as timer:
+            # The image list is fetched lazily, request the first page.
+            next(glance.images.list(limit=1), None)
+
+        get_time = time.time()
+
+        return [
+            Metric("gettime", get_time - start, min=0),
+            Metric("auth", round(auth_time, 6), uom="s", min=0, context="phase"),
+            *timer.metrics(),
+        ]
+
+    def _inventory(self):
+        from glanceclient.v2.client import Client
+
         start = time.time()
+        # Leave some headroom to report the partial results.
+        deadline = start + 0.8 * self.args.check_timeout
 
         glance = Client("2", session=self.session)
-        glance.images.list()
+
+        images = 0
+        size = 0
+        statuses = dict.fromkeys(STATUSES, 0)
+        visibilities = dict.fromkeys(VISIBILITIES, 0)
+
+        # Request the raw pages, the image models of glanceclient are not
+        # needed to count images. The image API does not support
+        # selecting fields. By default, community images and shared
+        # images not accepted by the project are left out of the list.
+        url = (
+            f"/v2/images?limit={self.args.page_size}"
+            "&visibility=all&member_status=all"
+        )
+        page_time = 0.0
+        while url:
+            if time.time() + page_time > deadline:
+                _log.warning("Image list incomplete, stopped before the check timeout")
+                break
+
+            page_start = time.time()
+            _, body = glance.http_client.get(url)
+            page_time = time.time() - page_start
+
+            for image in body["images"]:
+                images += 1
+                size += image.get("size") or 0
+                statuses[image["status"]] = statuses.get(image["status"], 0) + 1
+                visibility = image.get("visibility", "private")
+                visibilities[visibility] = visibilities.get(visibility, 0) + 1
+
+            url = body.get("next")
 
         get_time = time.time()
 
-        return Metric("gettime", get_time - start, min=0)
+        return [
+            Metric("gettime", get_time - start, min=0),
+            Metric("images", images, min=0),
+            Metric("bytes", size, uom="B", min=0, context="images"),
+            Metric("incomplete", int(bool(url))),
+            *[
+                Metric(f"status_{status}", count, min=0, context="images")
+                for status, count in statuses.items()
+            ],
+            *[
+                Metric(f"visibility_{visibility}", count, min=0, context="images")
+                for visibility, count in visibilities.items()
+            ],
+        ]
 
     @classmethod
     def setup(cls, options: _ArgumentGroup, parser: ArgumentParser):
@@ -76,6 +170,18 @@ class GlanceImages(osnag.Resource):
             default="0:",
             help="return critical if repsonse time is outside RANGE (default 1:, never critical)",
         )
+        options.add_argument(
+            "--inventory",
+            action="store_true",
+            help="walk the whole image list and count images by status and visibility",
+        )
+        options.add_argument(
+            "--page-size",
+            metavar="N",
+            type=int,
+            default=1000,
+            help="with --inventory, number of images to request at once (default: 1000)",
+        )
 
 
 def main():
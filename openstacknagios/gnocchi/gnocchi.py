@@ -25,8 +25,6 @@ Nagios/Icinga plugin to check gnocchi status
 This corresponds to the output of 'gnocchi status'.
 """
 
-from gnocchiclient.v1.client import Client
-
 import openstacknagios.openstacknagios as osnag
 
 
@@ -35,9 +33,7 @@ class Gnocchi(osnag.Resource):
     Get gnocchi client
     """
 
-    def __init__(self, args=None):
-        super().__init__()
-        self.args = args
-
     def get_client(self):
+        from gnocchiclient.v1.client import Client
+
         return Client(session=self.session)
@@ -22,12 +22,22 @@
 """
 Nagios/Icinga plugin to check gnocchi gnocchi measures
 
-This will check the amount of available measures for a project and a
-metric. Use a canary project to get measures (query for all available
-projects take to long !)
+This will check the amount of available measures for a metric of the
+resources of a project, or of all resources of a type. The measures are
+counted by gnocchi, so only one value per timestamp is transferred
+regardless of the number of resources. With --groupby, the measures are
+counted per group (e.g. per project) in a single query.
+
+Several metrics and projects can be checked in one run: all projects are
+queried at once and grouped by project, and the metrics are queried
+concurrently. Besides the number of measures, the age of the newest
+measure is reported.
 """
 
+import datetime
 from argparse import ArgumentParser, Namespace, _ArgumentGroup
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
 from nagiosplugin.check import Check
 from nagiosplugin.context import ScalarContext
@@ -36,6 +46,9 @@ from nagiosplugin.metric import Metric
 import openstacknagios.gnocchi.gnocchi as gnocchi
 import openstacknagios.openstacknagios as osnag
 
+# Number of metrics queried at the same time.
+MAX_CONCURRENT_REQUESTS = 8
+
 
 class GnocchiMeasures(gnocchi.Gnocchi):
     """
@@ -47,24 +60,73 @@ class GnocchiMeasures(gnocchi.Gnocchi):
 
         check.add(
             ScalarContext("measures", args.warn, args.critical),
+            ScalarContext("age", args.warn_age, args.critical_age),
             osnag.Summary(show=["measures"]),
         )
 
     def probe(self):
         client = self.get_client()
-        result = client.status.get()["storage"]["summary"]
-        result = client.aggregates.fetch(
-            operations=f"(metric {self.args.metric} mean)",
-            search=f"project_id={self.args.project_id}",
-            start=self.args.start,
-            stop=self.args.stop,
-        )["measures"]
-
-        count = 0
-        for res in result:
-            count = count + len(result[res][self.args.metric]["mean"])
 
-        return Metric("measures", count)
+        groupby = list(self.args.groupby or [])
+        if self.args.project_id:
+            search = {"in": {"project_id": self.args.project_id}}
+            if len(self.args.project_id) > 1 and "project_id" not in groupby:
+                groupby.append("project_id")
+        else:
+            search = {}
+
+        def fetch(metric: str):
+            # Count the mean values of all matching metrics per timestamp
+            # on the server instead of fetching the values of every
+            # resource.
+            return client.aggregates.fetch(
+                operations=f"(aggregate count (metric {metric} mean))",
+                search=search,
+                resource_type=self.args.resource_type,
+                start=self.args.start,
+                stop=self.args.stop,
+                granularity=self.args.granularity,
+                needed_overlap=0,
+                groupby=groupby or None,
+            )
+
+        with ThreadPoolExecutor(MAX_CONCURRENT_REQUESTS) as executor:
+            results = list(executor.map(fetch, self.args.metric))
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        metrics = []
+        total = 0
+
+        for metric, result in zip(self.args.metric, results):
+            if groupby:
+                groups = [
+                    (
+                        [str(group["group"][key]) for key in groupby],
+                        group["measures"]["measures"],
+                    )
+                    for group in result
+                ]
+            else:
+                groups = [([], result["measures"])]
+
+            for labels, measures in groups:
+                count, last = count_measures(measures)
+                total += count
+
+                if len(self.args.metric) > 1:
+                    labels = [metric, *labels]
+                prefix = "".join(f"{label}_" for label in labels)
+
+                # With a single metric and group, the total covers it.
+                if labels:
+                    metrics.append(
+                        Metric(f"{prefix}measures", count, context="measures")
+                    )
+                if last is not None:
+                    age = round((now - last).total_seconds())
+                    metrics.append(Metric(f"{prefix}age", age, uom="s", context="age"))
+
+        return [Metric("measures", total), *metrics]
 
     @classmethod
     def setup(cls, options: _ArgumentGroup, parser: ArgumentParser):
@@ -97,16 +159,67 @@ class GnocchiMeasures(gnocchi.Gnocchi):
             help="start timestamp to query, default +0h (now)",
         )
         options.add_argument(
-            "--project_id",
+            "--granularity",
+            metavar="SECONDS",
+            help="only count measures of this granularity, default all granularities",
+        )
+        options.add_argument(
+            "--project-id",
             metavar="PROJECT_ID",
+            action="append",
+            help="project id to query, default all projects, can be given multiple times to query and report several projects at once",
+        )
+        options.add_argument(
+            "--resource-type",
+            metavar="TYPE",
+            default="generic",
+            help="resource type to query, default generic",
+        )
+        options.add_argument(
+            "--groupby",
+            metavar="ATTRIBUTE",
+            action="append",
+            help="count measures per group of resources with the same ATTRIBUTE, e.g. project_id, can be given multiple times",
+        )
+        options.add_argument(
+            "--metric",
+            metavar="METRIC",
+            action="append",
             required=True,
-            help="project id to query (mandatory, since otherwise query takes too long!)",
+            help="metric to query, can be given multiple times to query and report several metrics at once",
         )
         options.add_argument(
-            "--metric", metavar="METRIC", required=True, help="metric to query"
+            "--warn-age",
+            metavar="RANGE",
+            default="0:",
+            help="return warning if the age of the newest measure in seconds is outside RANGE (default: 0:, never warn)",
+        )
+        options.add_argument(
+            "--critical-age",
+            metavar="RANGE",
+            default="0:",
+            help="return critical if the age of the newest measure in seconds is outside RANGE (default: 0:, never critical)",
         )
 
 
+def count_measures(
+    measures: dict,
+) -> tuple[int, Optional[datetime.datetime]]:
+    """
+    Sum up the counts of the aggregated series, which is the number of
+    mean values of all metrics, and return it along with the timestamp
+    of the newest value.
+    """
+    count = 0
+    last = None
+    for timestamp, _, value in measures.get("aggregated", []):
+        if value:
+            count += value
+            last = timestamp if last is None else max(last, timestamp)
+
+    return int(count), last
+
+
 def main():
     osnag.run_check(GnocchiMeasures)
 
@@ -23,8 +23,13 @@
 Nagios/Icinga plugin to check gnocchi status
 
 This corresponds to the output of 'gnocchi status'.
+
+The measures backlog of recent runs is kept in a local history, and the
+growth of the backlog and the estimated time until it is processed are
+derived from a linear fit over these samples.
 """
 
+import time
 from argparse import ArgumentParser, Namespace, _ArgumentGroup
 
 from nagiosplugin.check import Check
@@ -33,6 +38,7 @@ from nagiosplugin.metric import Metric
 
 import openstacknagios.openstacknagios as osnag
 from openstacknagios.gnocchi.gnocchi import Gnocchi
+from openstacknagios.history import History
 
 
 class GnocchiStatus(Gnocchi):
@@ -46,6 +52,8 @@ class GnocchiStatus(Gnocchi):
         check.add(
             ScalarContext("measures", args.warn, args.critical),
             ScalarContext("metrics", args.warn_metrics, args.critical_metrics),
+            ScalarContext("growth", args.warn_growth, args.critical_growth),
+            ScalarContext("drain", args.warn_drain, args.critical_drain),
             osnag.Summary(show=["measures", "metrics"]),
         )
 
@@ -55,11 +63,37 @@ class GnocchiStatus(Gnocchi):
 
         # {u'storage': {u'summary': {u'metrics': 98, u'measures': 98}}}
 
-        return [
+        metrics = [
             Metric("measures", result["measures"]),
             Metric("metrics", result["metrics"]),
         ]
 
+        if self.args.history < 1:
+            return metrics
+
+        name = "gnocchi-status {auth_url} {region_name}".format(
+            auth_url=self.region.config.get("auth", {}).get("auth_url"),
+            region_name=self.region.region_name,
+        )
+        with History(name, self.args.history, self.args.runtime_dir) as history:
+            history.append(time.time(), result["measures"])
+            slope = history.slope()
+
+        if slope is None:
+            return metrics
+
+        # Backlog change in measures per minute.
+        metrics.append(Metric("growth", round(slope * 60, 1)))
+
+        if result["measures"] == 0:
+            metrics.append(Metric("drain", 0, uom="s", min=0))
+        elif slope < 0:
+            metrics.append(
+                Metric("drain", round(result["measures"] / -slope), uom="s", min=0)
+            )
+
+        return metrics
+
     @classmethod
     def setup(cls, options: _ArgumentGroup, parser: ArgumentParser):
         super().setup(options, parser)
@@ -90,6 +124,37 @@ class GnocchiStatus(Gnocchi):
             default="0:200",
             help="return critical if number of metrics having measures to process is outside RANGE (default: 0:200)",
         )
+        options.add_argument(
+            "--history",
+            metavar="N",
+            type=int,
+            default=12,
+            help="number of recent samples to keep for the backlog trend, 0 to disable (default: 12)",
+        )
+        options.add_argument(
+            "--warn-growth",
+            metavar="RANGE",
+            default="~:",
+            help="return warning if the growth of measures to process per minute is outside RANGE (default: ~:, never warn)",
+        )
+        options.add_argument(
+            "--critical-growth",
+            metavar="RANGE",
+            default="~:",
+            help="return critical if the growth of measures to process per minute is outside RANGE (default: ~:, never critical)",
+        )
+        options.add_argument(
+            "--warn-drain",
+            metavar="RANGE",
+            default="0:",
+            help="return warning if the estimated seconds until all measures are processed is outside RANGE, only reported while the backlog shrinks (default: 0:, never warn)",
+        )
+        options.add_argument(
+            "--critical-drain",
+            metavar="RANGE",
+            default="0:",
+            help="return critical if the estimated seconds until all measures are processed is outside RANGE, only reported while the backlog shrinks (default: 0:, never critical)",
+        )
 
 
 def main():
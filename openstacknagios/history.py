@@ -0,0 +1,197 @@
+# pylint: disable=missing-docstring
+
+#
+#    Copyright (C) 2024  HPI  https://hpi.de
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Sample history kept across check invocations
+
+Checks reporting a trend, e.g. how fast a backlog grows, keep their
+recent samples in a fixed-size ring buffer in the runtime directory:
+
+    with History("gnocchi-status", size=12) as history:
+        history.append(time.time(), measures)
+        slope = history.slope()
+
+A history can hold several series, e.g. one per network, in the same
+file:
+
+    with History("networks", size=12, max_age=86400) as history:
+        history.series(network_id).append(time.time(), used_ips)
+
+No series grows beyond `size` samples, and series not appended to for
+`max_age` seconds are dropped, so updating the file costs the same on
+every run.
+"""
+
+import contextlib
+import json
+import logging
+import os
+import time
+from typing import IO, Optional
+
+from openstacknagios import cache
+
+_log = logging.getLogger("nagiosplugin")
+
+
+class Series:
+    """Ring buffer of `(timestamp, value, ...)` samples."""
+
+    def __init__(
+        self, size: int, samples: Optional[list[list[float]]] = None, start: int = 0
+    ):
+        self.size = size
+        self._samples = samples or []
+        self._next = start
+
+        # Keep the newest samples in order, in case the size changed.
+        self._samples = self.samples[-self.size :]
+        self._next = len(self._samples) % self.size
+
+    @property
+    def samples(self) -> list[list[float]]:
+        """All samples, oldest first."""
+        return self._samples[self._next :] + self._samples[: self._next]
+
+    def append(self, timestamp: float, *values: float) -> None:
+        sample = [timestamp, *values]
+
+        if len(self._samples) < self.size:
+            self._samples.append(sample)
+        else:
+            self._samples[self._next] = sample
+
+        self._next = (self._next + 1) % self.size
+
+    def slope(self, index: int = 1) -> Optional[float]:
+        """
+        Return the change per second of the `index`th value of the
+        samples, from a least-squares linear fit. Returns None if there
+        are not enough samples to fit a line.
+        """
+        points = [(sample[0], sample[index]) for sample in self.samples]
+        if len(points) < 2:
+            return None
+
+        mean_t = sum(t for t, _ in points) / len(points)
+        mean_v = sum(v for _, v in points) / len(points)
+        variance = sum((t - mean_t) ** 2 for t, _ in points)
+        if variance == 0:
+            return None
+
+        return sum((t - mean_t) * (v - mean_v) for t, v in points) / variance
+
+    def state(self) -> dict:
+        return {"next": self._next, "samples": self._samples}
+
+
+class History:
+    """
+    Series of samples stored in a locked file below the runtime
+    directory, each in a ring buffer of `size` samples. The samples are
+    written back when the context is left without an exception, without
+    the series whose newest sample is older than `max_age` seconds.
+
+    `append`, `samples` and `slope` use the default series, for a
+    history of a single series.
+
+    If the file cannot be used, a warning is logged and the history only
+    holds the samples appended within the context.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        size: int,
+        directory: Optional[str] = None,
+        max_age: Optional[float] = None,
+    ):
+        if size < 1:
+            raise ValueError("History size must be at least 1")
+
+        self.name = name
+        self.size = size
+        self.directory = directory
+        self.max_age = max_age
+        self._stack = contextlib.ExitStack()
+        self._file: Optional[IO[str]] = None
+        self._series: dict[str, Series] = {}
+
+    def __enter__(self) -> "History":
+        try:
+            path = os.path.join(
+                cache.runtime_dir(self.directory),
+                f"history-{cache.cache_key(self.name)}.json",
+            )
+            self._file = self._stack.enter_context(cache.locked_file(path))
+        except OSError as err:
+            _log.warning("History unavailable: %s", err)
+            return self
+
+        try:
+            content = self._file.read()
+            if content:
+                self._series = {
+                    key: Series(self.size, state["samples"], state["next"])
+                    for key, state in json.loads(content)["series"].items()
+                }
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as err:
+            _log.warning("Ignoring invalid history file %s: %s", path, err)
+            self._series = {}
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        try:
+            if exc_type is None and self._file is not None:
+                self._file.seek(0)
+                self._file.truncate()
+                json.dump({"series": self._current()}, self._file)
+                self._file.flush()
+        except OSError as err:
+            _log.warning("Cannot update history: %s", err)
+        finally:
+            self._stack.close()
+            self._file = None
+
+    def _current(self) -> dict[str, dict]:
+        expires = None if self.max_age is None else time.time() - self.max_age
+
+        return {
+            key: series.state()
+            for key, series in self._series.items()
+            if series.samples and (expires is None or series.samples[-1][0] >= expires)
+        }
+
+    def series(self, key: str = "") -> Series:
+        """Return the series `key`, which is created if necessary."""
+        if key not in self._series:
+            self._series[key] = Series(self.size)
+        return self._series[key]
+
+    @property
+    def samples(self) -> list[list[float]]:
+        """All samples of the default series, oldest first."""
+        return self.series().samples
+
+    def append(self, timestamp: float, *values: float) -> None:
+        self.series().append(timestamp, *values)
+
+    def slope(self, index: int = 1) -> Optional[float]:
+        return self.series().slope(index)
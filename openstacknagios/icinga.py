@@ -6,6 +6,7 @@ from typing import Any, Type
 
 ICINGA_ARGUMENTS_IGNORE = (
     "--help",
+    "--help-all",
     "--print-command-definition",
     "--verbose",
 )
@@ -17,6 +18,9 @@ ICINGA_ARGUMENT_ALIAS = {
 }
 
 
+# Template holding the OpenStack options, imported by every check command.
+TEMPLATE_NAME = "openstack"
+
 ICINGA_ESCAPE = str.maketrans(
     {
         '"': r"\"",
@@ -63,9 +67,35 @@ def generate_command_definition(resource_class: Type, parser: ArgumentParser):
 
     lines = [
         f'object CheckCommand "{check_name}" {{',
+        f'    import "{TEMPLATE_NAME}"',
+        "",
         f'    command = [ "{check_path}" ]',
     ]
+    lines.extend(format_arguments(parser, arg_prefix))
+    lines.append("}")
+
+    return "\n".join(lines) + "\n"
+
+
+def generate_template() -> str:
+    """
+    Return the command template with the OpenStack options shared by all
+    checks, which are left out of the check command definitions.
+    """
+    import openstack.config.loader
+
+    parser = ArgumentParser(add_help=False)
+    config = openstack.config.loader.OpenStackConfig(app_name="openstacknagios")
+    config.register_argparse_arguments(parser, [])
+
+    lines = [f'template CheckCommand "{TEMPLATE_NAME}" {{']
+    lines.extend(format_arguments(parser, "openstack"))
+    lines.append("}")
 
+    return "\n".join(lines) + "\n"
+
+
+def format_arguments(parser: ArgumentParser, arg_prefix: str) -> list[str]:
     arguments: dict[str, Any] = {}
 
     for action in parser._actions:  # pylint: disable=protected-access
@@ -94,19 +124,18 @@ def generate_command_definition(resource_class: Type, parser: ArgumentParser):
             if action.required:
                 arguments[cmd]["required"] = True
 
-    if arguments:
-        lines.append("    arguments += {")
-        for name, argument in arguments.items():
-            lines.append(f'        "{name}" = {{')
-            for key, value in argument.items():
-                lines.append(f"            {key} = {escape_value(value)}")
-            lines.append("        }")
-
-        lines.append("    }")
+    if not arguments:
+        return []
 
-    lines.append("}")
+    lines = ["    arguments += {"]
+    for name, argument in arguments.items():
+        lines.append(f'        "{name}" = {{')
+        for key, value in argument.items():
+            lines.append(f"            {key} = {escape_value(value)}")
+        lines.append("        }")
+    lines.append("    }")
 
-    return "\n".join(lines) + "\n"
+    return lines
 
 
 def escape_value(val: Any):
@@ -114,3 +143,7 @@ def escape_value(val: Any):
         return '"' + str(val).translate(ICINGA_ESCAPE) + '"'
     else:
         return val
+
+
+if __name__ == "__main__":
+    print(generate_template())
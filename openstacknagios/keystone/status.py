@@ -23,13 +23,17 @@
 Nagios/Icinga plugin to check keystone
 
 The check will get a token and mesure the time used.
+
+A new token is issued on every run and then verified with the chosen
+keystoneclient version. Besides the total time, the time to issue the
+token and the time spent in each phase of the HTTP requests (DNS lookup,
+TCP connect, TLS handshake, time to first byte and reading the body)
+are reported.
 """
 
 import time
 from argparse import ArgumentParser, Namespace, _ArgumentGroup
 
-import keystoneclient.v2_0.client as ksclient2
-import keystoneclient.v3.client as ksclient3
 from nagiosplugin.check import Check
 from nagiosplugin.context import ScalarContext
 from nagiosplugin.metric import Metric
@@ -47,21 +51,44 @@ class KeystoneStatus(osnag.Resource):
 
         check.add(
             ScalarContext("gettime", args.warn, args.critical),
+            ScalarContext("phase"),
             osnag.Summary(show=["gettime"]),
         )
 
     def probe(self):
-        start = time.time()
+        import keystoneclient.v2_0.client as ksclient2
+        import keystoneclient.v3.client as ksclient3
+
+        from openstacknagios.timing import RequestTimer
+
         if self.args.token_version == "2":
-            ksclient2.Client(session=self.session)
+            client_class = ksclient2.Client
         elif self.args.token_version == "3":
-            ksclient3.Client(session=self.session)
+            client_class = ksclient3.Client
         else:
             raise ValueError(f"Unknown token-version: {self.args.token_version}")
 
+        session = self.session
+
+        start = time.time()
+        with RequestTimer(session) as timer:
+            # Issue a new token rather than using the (cached) token of
+            # the session.
+            access = session.auth.get_auth_ref(session)
+            auth_time = time.time() - start
+
+            client = client_class(
+                session=session, interface=self.region.get_interface("identity")
+            )
+            client.tokens.validate(access.auth_token)
+
         get_time = time.time()
 
-        return Metric("gettime", get_time - start, min=0)
+        return [
+            Metric("gettime", get_time - start, min=0),
+            Metric("auth", round(auth_time, 6), uom="s", min=0, context="phase"),
+            *timer.metrics(),
+        ]
 
     @classmethod
     def setup(cls, options: _ArgumentGroup, parser: ArgumentParser):
@@ -69,6 +96,7 @@ class KeystoneStatus(osnag.Resource):
 
         options.add_argument(
             "--tversion",
+            dest="token_version",
             metavar="TOKENVERSION",
             default="3",
             help="the version of the keystoneclient to use to verify the token. currently supported is 3 and 2 (default 3)",
@@ -26,22 +26,24 @@ This corresponds to the output of 'neutron agent-list'.
 """
 
 from argparse import ArgumentParser, Namespace, _ArgumentGroup
+from typing import TYPE_CHECKING
 
 from nagiosplugin.check import Check
 from nagiosplugin.context import ScalarContext
 from nagiosplugin.metric import Metric
-from neutronclient.neutron import client
-from openstack.config.cloud_region import CloudRegion
 
 import openstacknagios.openstacknagios as osnag
 
+if TYPE_CHECKING:
+    from openstack.config.cloud_region import CloudRegion
+
 
 class NeutronAgents(osnag.Resource):
     """
     Determines the status of the neutron agents.
     """
 
-    def __init__(self, check: Check, args: Namespace, region: CloudRegion) -> None:
+    def __init__(self, check: Check, args: Namespace, region: "CloudRegion") -> None:
         super().__init__(check, args, region)
         self.binary = args.binary
         self.host = args.host
@@ -54,41 +56,55 @@ class NeutronAgents(osnag.Resource):
             ScalarContext("disabled", args.warn_disabled, args.critical_disabled),
             ScalarContext("down", args.warn_down, args.critical_down),
             ScalarContext("total", "0:", "@0"),
+            ScalarContext("snapshot_age"),
             osnag.Summary(show=["up", "disabled", "down"]),
         )
 
     def probe(self):
-        neutron = client.Client("2.0", session=self.session)
-
-        if self.host and self.binary:
-            result = neutron.list_agents(host=self.host, binary=self.binary)
-        elif self.binary:
-            result = neutron.list_agents(binary=self.binary)
-        elif self.host:
-            result = neutron.list_agents(host=self.host)
+        from neutronclient.neutron import client
+
+        def fetch(host=None):
+            neutron = client.Client("2.0", session=self.session)
+
+            filters = {}
+            if self.binary:
+                filters["binary"] = self.binary
+            if host:
+                filters["host"] = host
+
+            return neutron.list_agents(**filters)["agents"]
+
+        metrics = []
+
+        # A single host is filtered by the API, otherwise all agents are
+        # fetched once and grouped by host. With a snapshot, all agents
+        # are shared with the checks of other hosts.
+        if self.args.snapshot_ttl:
+            result, age = self.snapshot(
+                f"network agents {self.binary}", fetch, "host", self.host
+            )
+            metrics.append(Metric("snapshot_age", round(age, 1), uom="s", min=0))
+        elif self.host and len(self.host) == 1:
+            result = fetch(self.host[0])
         else:
-            result = neutron.list_agents()
-
-        agents_up = 0
-        agents_disabled = 0
-        agents_down = 0
-        agents_total = 0
-
-        for agent in result["agents"]:
-            agents_total += 1
-            if agent["admin_state_up"] and agent["alive"]:
-                agents_up += 1
-            elif not agent["admin_state_up"]:
-                agents_disabled += 1
-            else:
-                agents_down += 1
-
-        return [
-            Metric("up", agents_up, min=0),
-            Metric("disabled", agents_disabled, min=0),
-            Metric("down", agents_down, min=0),
-            Metric("total", agents_total, min=0),
-        ]
+            result = fetch()
+
+        metrics.extend(
+            osnag.service_metrics(
+                ((agent["host"], self._state(agent)) for agent in result),
+                hosts=self.host,
+                per_host=self.args.per_host,
+            )
+        )
+        return metrics
+
+    @staticmethod
+    def _state(agent) -> str:
+        if agent["admin_state_up"] and agent["alive"]:
+            return "up"
+        if not agent["admin_state_up"]:
+            return "disabled"
+        return "down"
 
     @classmethod
     def setup(cls, options: _ArgumentGroup, parser: ArgumentParser):
@@ -141,9 +157,16 @@ class NeutronAgents(osnag.Resource):
         options.add_argument(
             "--host",
             dest="host",
-            default="",
-            help="filter hostname",
+            action="append",
+            default=None,
+            help="filter hostname, can be given multiple times to check several hosts at once",
+        )
+        options.add_argument(
+            "--per-host",
+            action="store_true",
+            help="report metrics for each host in addition to the totals",
         )
+        osnag.snapshot_option(options)
 
 
 def main():
@@ -30,7 +30,6 @@ from argparse import ArgumentParser, Namespace, _ArgumentGroup
 from nagiosplugin.check import Check
 from nagiosplugin.context import ScalarContext
 from nagiosplugin.metric import Metric
-from neutronclient.neutron import client
 
 import openstacknagios.openstacknagios as osnag
 
@@ -46,26 +45,68 @@ class NeutronFloatingIPs(osnag.Resource):
         check.add(
             ScalarContext("assigned", args.warn, args.critical),
             ScalarContext("used"),
+            ScalarContext("per_network"),
+            ScalarContext("per_project"),
             osnag.Summary(show=["assigned", "used"]),
         )
 
     def probe(self):
+        from neutronclient.neutron import client
+
         neutron = client.Client("2.0", session=self.session)
-        result = neutron.list_floatingips()
+
+        # Only request the fields needed for counting, and walk through
+        # the result page by page, so that memory usage does not depend
+        # on the number of floating IPs.
+        breakdown_keys = []
+        if self.args.per_network:
+            breakdown_keys.append(("network", "floating_network_id"))
+        if self.args.per_project:
+            breakdown_keys.append(("project", "project_id"))
+
+        fields = ["id", "fixed_ip_address"] + [key for _, key in breakdown_keys]
+
+        params = {"fields": fields}
+        if self.args.page_size:
+            params["limit"] = self.args.page_size
 
         assigned = 0
         used = 0
+        breakdown = {"network": {}, "project": {}}
+
+        for page in neutron.list_floatingips(retrieve_all=False, **params):
+            for floatingip in page["floatingips"]:
+                assigned += 1
+                if floatingip["fixed_ip_address"]:
+                    used += 1
 
-        for floatingip in result["floatingips"]:
-            assigned += 1
-            if floatingip["fixed_ip_address"]:
-                used += 1
+                for kind, key in breakdown_keys:
+                    counts = breakdown[kind].setdefault(floatingip[key], [0, 0])
+                    counts[0] += 1
+                    if floatingip["fixed_ip_address"]:
+                        counts[1] += 1
 
-        return [
+        metrics = [
             Metric("assigned", assigned, min=0),
             Metric("used", used, min=0),
         ]
 
+        for kind, counts in breakdown.items():
+            for key, (key_assigned, key_used) in sorted(counts.items()):
+                metrics.append(
+                    Metric(
+                        f"{kind}_{key}_assigned",
+                        key_assigned,
+                        min=0,
+                        context=f"per_{kind}",
+                    )
+                )
+                metrics.append(
+                    Metric(f"{kind}_{key}_used", key_used, min=0, context=f"per_{kind}")
+                )
+
+        return metrics
+
     @classmethod
     def setup(cls, options: _ArgumentGroup, parser: ArgumentParser):
         super().setup(options, parser)
@@ -84,6 +125,23 @@ class NeutronFloatingIPs(osnag.Resource):
             default="0:230",
             help="return critical if number of assigned floating ip's is outside RANGE (default 0:230, critical if more than 230 are used)",
         )
+        options.add_argument(
+            "--page-size",
+            metavar="N",
+            type=int,
+            default=1000,
+            help="number of floating ip's to fetch per request, 0 to fetch all at once (default: 1000)",
+        )
+        options.add_argument(
+            "--per-network",
+            action="store_true",
+            help="additionally report assigned and used floating ip's per external network",
+        )
+        options.add_argument(
+            "--per-project",
+            action="store_true",
+            help="additionally report assigned and used floating ip's per project",
+        )
 
 
 def main():
@@ -21,14 +21,25 @@ Nagios/Icinga plugin to check available IPs
 This corresponds to the output of 'openstack ip availabilities show'.
 """
 
+import contextlib
+import time
 from argparse import ArgumentParser, Namespace, _ArgumentGroup
+from typing import ContextManager, Optional
 
 from nagiosplugin.check import Check
 from nagiosplugin.context import ScalarContext
 from nagiosplugin.metric import Metric
-from neutronclient.neutron import client
+from nagiosplugin.state import Ok
 
 import openstacknagios.openstacknagios as osnag
+from openstacknagios.history import History
+
+# Minimum number of samples to forecast the exhaustion of a network.
+MIN_SAMPLES = 3
+
+# Seconds after which the samples of a network no longer checked, e.g. a
+# deleted one, are dropped from the history.
+HISTORY_MAX_AGE = 24 * 3600
 
 
 class NeutronNetworkIPAvailability(osnag.Resource):
@@ -42,17 +53,107 @@ class NeutronNetworkIPAvailability(osnag.Resource):
         check.add(
             ScalarContext("total"),
             ScalarContext("used", args.warn, args.critical),
-            osnag.Summary(show=["total", "used"]),
+            ScalarContext("networks"),
+            ScalarContext("usage", args.warn_usage, args.critical_usage),
+            ScalarContext("exhaustion", args.warn_exhaustion, args.critical_exhaustion),
+            UsageSummary(show=["networks", "total", "used"]),
         )
 
     def probe(self):
+        from neutronclient.neutron import client
+
         neutron = client.Client("2.0", session=self.session)
-        result = neutron.show_network_ip_availability(self.args.network_uuid)
-        net_ip = result["network_ip_availability"]
+
+        single = self.args.network and len(self.args.network) == 1
+        if single:
+            result = neutron.show_network_ip_availability(self.args.network[0])
+            networks = [result["network_ip_availability"]]
+        else:
+            # Fetch the availability of all (or the given) networks at
+            # once and evaluate the usage of each network.
+            filters = {}
+            if self.args.network:
+                filters["network_id"] = self.args.network
+
+            result = neutron.list_network_ip_availabilities(**filters)
+            networks = result["network_ip_availabilities"]
+
+        with self.history() as history:
+            if single:
+                net_ip = networks[0]
+                metrics = [
+                    Metric("total", net_ip["total_ips"], min=0),
+                    Metric("used", net_ip["used_ips"], min=0),
+                ]
+
+                hours = forecast(history, net_ip)
+                if hours is not None:
+                    metrics.append(Metric("exhaustion", hours, uom="h", min=0))
+
+                return metrics
+
+            return self.usage_metrics(networks, history)
+
+    def history(self) -> ContextManager[Optional[History]]:
+        """
+        Return the history of the used ip's of all networks of the cloud
+        region, or a null context without history if it is disabled.
+        """
+        if self.args.history < 1:
+            return contextlib.nullcontext()
+
+        name = "network-ip-availability {auth_url} {region_name}".format(
+            auth_url=self.region.config.get("auth", {}).get("auth_url"),
+            region_name=self.region.region_name,
+        )
+        return History(
+            name, self.args.history, self.args.runtime_dir, max_age=HISTORY_MAX_AGE
+        )
+
+    def usage_metrics(
+        self, networks: list[dict], history: Optional[History]
+    ) -> list[Metric]:
+        names = [network["network_name"] for network in networks]
+        total = 0
+        used = 0
+        metrics = []
+
+        for network in networks:
+            total += network["total_ips"]
+            used += network["used_ips"]
+
+            # Network names are neither required nor unique.
+            name = network["network_name"]
+            if not name or names.count(name) > 1:
+                name = network["network_id"]
+
+            if network["total_ips"]:
+                metrics.append(usage_metric(name, network))
+
+            hours = forecast(history, network)
+            if hours is not None:
+                metrics.append(
+                    Metric(
+                        f"{name}_exhaustion",
+                        hours,
+                        uom="h",
+                        min=0,
+                        context="exhaustion",
+                    )
+                )
+
+            if self.args.per_subnet:
+                metrics.extend(
+                    usage_metric(f"{name}_{subnet['cidr']}", subnet)
+                    for subnet in network["subnet_ip_availability"]
+                    if subnet["total_ips"]
+                )
 
         return [
-            Metric("total", net_ip["total_ips"], min=0),
-            Metric("used", net_ip["used_ips"], min=0),
+            Metric("networks", len(networks), min=0),
+            Metric("total", total, min=0),
+            Metric("used", used, min=0, context="total"),
+            *metrics,
         ]
 
     @classmethod
@@ -76,9 +177,100 @@ class NeutronNetworkIPAvailability(osnag.Resource):
         options.add_argument(
             "-n",
             "--network",
-            required=True,
-            help="The network to check",
+            action="append",
+            help="The network to check, can be given multiple times (default: all networks)",
+        )
+        options.add_argument(
+            "--warn-usage",
+            metavar="RANGE",
+            default="0:80",
+            help="with several or all networks, return warning if the percentage of used ip's of a network is outside RANGE (default: 0:80)",
+        )
+        options.add_argument(
+            "--critical-usage",
+            metavar="RANGE",
+            default="0:90",
+            help="with several or all networks, return critical if the percentage of used ip's of a network is outside RANGE (default: 0:90)",
         )
+        options.add_argument(
+            "--per-subnet",
+            action="store_true",
+            help="with several or all networks, also report the usage of each subnet",
+        )
+        options.add_argument(
+            "--history",
+            metavar="N",
+            type=int,
+            default=12,
+            help="number of recent samples to keep for forecasting the exhaustion of each network, 0 to disable (default: 12)",
+        )
+        options.add_argument(
+            "--warn-exhaustion",
+            metavar="RANGE",
+            default="24:",
+            help="return warning if the estimated hours until all ip's of a network are used is outside RANGE, only reported while the usage grows (default: 24:)",
+        )
+        options.add_argument(
+            "--critical-exhaustion",
+            metavar="RANGE",
+            default="4:",
+            help="return critical if the estimated hours until all ip's of a network are used is outside RANGE, only reported while the usage grows (default: 4:)",
+        )
+
+
+def forecast(history: Optional[History], network: dict) -> Optional[float]:
+    """
+    Record the used ip's of `network` in its series of the `history` and
+    return the hours until all ip's are used at the recent rate, or None
+    while the usage does not grow or without history.
+    """
+    if history is None:
+        return None
+
+    series = history.series(network["network_id"])
+    series.append(time.time(), network["used_ips"], network["total_ips"])
+    if len(series.samples) < MIN_SAMPLES:
+        return None
+
+    slope = series.slope()
+    if slope is None or slope <= 0:
+        return None
+
+    free = max(0, network["total_ips"] - network["used_ips"])
+    return round(free / slope / 3600, 1)
+
+
+class UsageSummary(osnag.Summary):
+    """Name every network with a usage or forecast outside the thresholds."""
+
+    def problem(self, results):
+        problems = sorted(
+            (
+                result
+                for result in results
+                if result.state != Ok
+                and result.metric is not None
+                and result.metric.context in ("usage", "exhaustion")
+            ),
+            key=lambda result: result.state.code,
+            reverse=True,
+        )
+        if not problems:
+            return super().problem(results)
+
+        return (
+            ", ".join(str(result) for result in problems)
+            + "["
+            + self._metrics(results)
+            + "]"
+        )
+
+
+def usage_metric(name: str, availability: dict) -> Metric:
+    usage = 100 * availability["used_ips"] / availability["total_ips"]
+    return Metric(
+        f"{name}_usage", round(usage, 2), uom="%", min=0, max=100, context="usage"
+    )
 
 
 def main():
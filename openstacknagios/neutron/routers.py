@@ -29,14 +29,17 @@ This corresponds to the output of 'neutron router-list -c id -c status'.
 """
 
 from argparse import ArgumentParser, Namespace, _ArgumentGroup
+from concurrent.futures import ThreadPoolExecutor
 
 from nagiosplugin.check import Check
 from nagiosplugin.context import ScalarContext
 from nagiosplugin.metric import Metric
-from neutronclient.neutron import client
 
 import openstacknagios.openstacknagios as osnag
 
+# Router states reported by the check, and their metric names.
+STATUSES = {"ACTIVE": "active", "DOWN": "down", "BUILD": "build"}
+
 
 class NeutronRouters(osnag.Resource):
     """
@@ -50,29 +53,70 @@ class NeutronRouters(osnag.Resource):
             ScalarContext("active"),
             ScalarContext("down", args.warn, args.critical),
             ScalarContext("build", args.warn_build, args.critical_build),
+            ScalarContext(
+                "agent_routers", args.warn_agent_routers, args.critical_agent_routers
+            ),
             osnag.Summary(show=["active", "down", "build"]),
         )
 
     def probe(self):
+        from neutronclient.neutron import client
+
         neutron = client.Client("2.0", session=self.session)
-        result = neutron.list_routers()
 
-        active = 0
-        down = 0
-        build = 0
+        if self.args.per_status:
+            counts = self.count_per_status(neutron)
+        else:
+            counts = self.count_statuses(neutron)
+
+        metrics = [
+            Metric(name, counts[status], min=0) for status, name in STATUSES.items()
+        ]
+
+        if self.args.per_agent:
+            metrics.extend(self.agent_metrics(neutron))
+
+        return metrics
+
+    def count_statuses(self, neutron) -> dict[str, int]:
+        # Only request the status of each router, page by page, instead
+        # of all attributes of all routers at once.
+        params = {"fields": "status"}
+        if self.args.page_size:
+            params["limit"] = self.args.page_size
+
+        counts = dict.fromkeys(STATUSES, 0)
+        for page in neutron.list_routers(retrieve_all=False, **params):
+            for router in page["routers"]:
+                if router["status"] in counts:
+                    counts[router["status"]] += 1
 
-        for router in result["routers"]:
-            if router["status"] == "ACTIVE":
-                active += 1
-            if router["status"] == "DOWN":
-                down += 1
-            if router["status"] == "BUILD":
-                build += 1
+        return counts
+
+    def count_per_status(self, neutron) -> dict[str, int]:
+        # Filter by status on the server, requesting only the ids of the
+        # routers in each state.
+        def count(status: str) -> int:
+            return len(neutron.list_routers(status=status, fields="id")["routers"])
+
+        with ThreadPoolExecutor(len(STATUSES)) as executor:
+            return dict(zip(STATUSES, executor.map(count, STATUSES)))
+
+    def agent_metrics(self, neutron) -> list[Metric]:
+        # L3 agents report the number of routers they host, so a single
+        # agent list covers the distribution.
+        result = neutron.list_agents(
+            agent_type="L3 agent", fields=["host", "configurations"]
+        )
 
         return [
-            Metric("active", active, min=0),
-            Metric("down", down, min=0),
-            Metric("build", build, min=0),
+            Metric(
+                f"{agent['host']}_routers",
+                agent["configurations"].get("routers", 0),
+                min=0,
+                context="agent_routers",
+            )
+            for agent in sorted(result["agents"], key=lambda agent: agent["host"])
         ]
 
     @classmethod
@@ -107,6 +151,40 @@ class NeutronRouters(osnag.Resource):
             help='Critical range for BUILD routers (default: ":10")',
         )
 
+        options.add_argument(
+            "--page-size",
+            metavar="N",
+            type=int,
+            default=0,
+            help="number of routers to request at once (default: 0, all at once)",
+        )
+
+        options.add_argument(
+            "--per-status",
+            action="store_true",
+            help="count the routers in each state with a separate query filtered by the server, instead of listing the status of all routers",
+        )
+
+        options.add_argument(
+            "--per-agent",
+            action="store_true",
+            help="report the number of routers hosted by each L3 agent",
+        )
+
+        options.add_argument(
+            "--warn-agent-routers",
+            metavar="RANGE",
+            default=None,
+            help="with --per-agent, return warning if the number of routers on an L3 agent is outside RANGE (default: never warn)",
+        )
+
+        options.add_argument(
+            "--critical-agent-routers",
+            metavar="RANGE",
+            default=None,
+            help="with --per-agent, return critical if the number of routers on an L3 agent is outside RANGE (default: never critical)",
+        )
+
 
 def main():
     osnag.run_check(NeutronRouters)
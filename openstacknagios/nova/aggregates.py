@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# pylint: disable=missing-docstring
+
+#
+#    Copyright (C) 2024  HPI  https://hpi.de
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Nagios/Icinga plugin to check capacity of nova host aggregates
+
+Reports vcpu and memory usage per host aggregate or availability zone.
+Aggregates and hypervisors are fetched once and joined by host name.
+"""
+
+from argparse import ArgumentParser, Namespace, _ArgumentGroup
+
+from nagiosplugin.check import Check
+from nagiosplugin.context import ScalarContext
+from nagiosplugin.metric import Metric
+
+import openstacknagios.openstacknagios as osnag
+from openstacknagios.nova.hypervisors import (
+    hypervisor_metrics,
+    hypervisor_totals,
+    list_hypervisors,
+)
+
+# Availability zone of hosts not in any aggregate with a zone set. This
+# corresponds to the default of nova's default_availability_zone option.
+DEFAULT_AVAILABILITY_ZONE = "nova"
+
+
+class NovaAggregates(osnag.Resource):
+    """
+    Determines vcpu and memory usage per host aggregate or availability zone.
+    """
+
+    def configure(self, check: Check, args: Namespace):
+        super().configure(check, args)
+
+        check.add(
+            ScalarContext("groups", "1:", "1:"),
+            ScalarContext("running_vms"),
+            ScalarContext("vcpus_used"),
+            ScalarContext(
+                "vcpus_percent",
+                args.warn_vcpus_percent,
+                args.critical_vcpus_percent,
+            ),
+            ScalarContext("memory_used"),
+            ScalarContext(
+                "memory_percent",
+                args.warn_memory_percent,
+                args.critical_memory_percent,
+            ),
+            osnag.Summary(show=["groups"]),
+        )
+
+    def probe(self):
+        from novaclient.client import Client
+
+        nova = Client("2.53", session=self.session)
+
+        aggregates = nova.aggregates.list()
+        hypervisors = list_hypervisors(nova)
+
+        # Aggregates reference compute service hosts, which can differ
+        # from the hypervisor hostname (e.g. FQDN vs. short name).
+        by_host = {}
+        for hypervisor in hypervisors:
+            by_host.setdefault(hypervisor.service["host"], []).append(hypervisor)
+
+        groups = {}
+        if self.args.group_by == "availability_zone":
+            zoned = set()
+            for aggregate in aggregates:
+                if aggregate.availability_zone:
+                    groups.setdefault(aggregate.availability_zone, set()).update(
+                        aggregate.hosts
+                    )
+                    zoned.update(aggregate.hosts)
+
+            unzoned = set(by_host) - zoned
+            if unzoned:
+                groups.setdefault(DEFAULT_AVAILABILITY_ZONE, set()).update(unzoned)
+        else:
+            for aggregate in aggregates:
+                groups[aggregate.name] = set(aggregate.hosts)
+
+        if self.args.name:
+            groups = {
+                name: hosts for name, hosts in groups.items() if name in self.args.name
+            }
+
+        metrics = [Metric("groups", len(groups), min=0)]
+
+        for name, hosts in sorted(groups.items()):
+            members = [h for host in sorted(hosts) for h in by_host.get(host, [])]
+            metrics.extend(
+                hypervisor_metrics(*hypervisor_totals(members), prefix=f"{name}_")
+            )
+
+        return metrics
+
+    @classmethod
+    def setup(cls, options: _ArgumentGroup, parser: ArgumentParser):
+        super().setup(options, parser)
+
+        options.add_argument(
+            "--group-by",
+            choices=["aggregate", "availability_zone"],
+            default="aggregate",
+            help="report usage per host aggregate or per availability zone (default: aggregate)",
+        )
+        options.add_argument(
+            "--name",
+            action="append",
+            default=None,
+            help="only report the aggregate or availability zone NAME, can be given multiple times",
+        )
+        options.add_argument(
+            "--warn-memory-percent",
+            metavar="RANGE",
+            default="0:90",
+            help="return warning if used memory of an aggregate is outside percent RANGE (default: 0:90, warn if 90%% of memory is used)",
+        )
+        options.add_argument(
+            "--critical-memory-percent",
+            metavar="RANGE",
+            default="0:95",
+            help="return critical if used memory of an aggregate is outside percent RANGE (default: 0:95, critical if 95%% of memory is used)",
+        )
+        options.add_argument(
+            "--warn-vcpus-percent",
+            metavar="RANGE",
+            default="0:90",
+            help="return warning if used vcpus of an aggregate is outside percent RANGE (default: 0:90, warn if 90%% of vcpus are used)",
+        )
+        options.add_argument(
+            "--critical-vcpus-percent",
+            metavar="RANGE",
+            default="0:95",
+            help="return critical if used vcpus of an aggregate is outside percent RANGE (default: 0:95, critical if 95%% of vcpus are used)",
+        )
+
+
+def main():
+    osnag.run_check(NovaAggregates)
+
+
+if __name__ == "__main__":
+    main()
@@ -30,7 +30,6 @@ from argparse import ArgumentParser, Namespace, _ArgumentGroup
 from nagiosplugin.check import Check
 from nagiosplugin.context import ScalarContext
 from nagiosplugin.metric import Metric
-from novaclient.client import Client
 
 import openstacknagios.openstacknagios as osnag
 
@@ -77,46 +76,44 @@ class NovaHypervisors(osnag.Resource):
         )
 
     def probe(self):
-        nova = Client("2.1", session=self.session)
+        from novaclient.client import Client
+
+        # Microversion 2.53 adds the hypervisor_hostname_pattern filter,
+        # resource usage fields were removed from hypervisors in 2.88.
+        nova = Client("2.53", session=self.session)
+
+        if self.args.per_host:
+            hypervisors = list_hypervisors(nova)
+            metrics = hypervisor_metrics(*hypervisor_totals(hypervisors))
+
+            for hypervisor in sorted(hypervisors, key=lambda h: h.hypervisor_hostname):
+                metrics.extend(
+                    hypervisor_metrics(
+                        *hypervisor_totals([hypervisor]),
+                        prefix=f"{hypervisor.hypervisor_hostname}_",
+                    )
+                )
+
+            return metrics
 
         if self.args.host:
-            result = nova.hypervisors.get(
-                nova.hypervisors.find(hypervisor_hostname=self.args.host)
-            )
-        else:
-            result = nova.hypervisors.statistics()
-
-        return [
-            Metric(
-                "vcpus_used",
-                result.vcpus_used,
-                min=0,
-                max=result.vcpus,
-            ),
-            Metric(
-                "vcpus_percent",
-                100 * result.vcpus_used / result.vcpus,
-                min=0,
-                max=100,
-            ),
-            Metric(
-                "memory_used",
-                result.memory_mb_used,
-                min=0,
-                max=result.memory_mb,
-            ),
-            Metric(
-                "memory_percent",
-                100 * result.memory_mb_used / result.memory_mb,
-                min=0,
-                max=100,
-            ),
-            Metric(
-                "running_vms",
-                result.running_vms,
-                min=0,
-            ),
-        ]
+            # The pattern matches substrings, so pick the exact host from
+            # the (usually single) result.
+            for hypervisor in nova.hypervisors.search(self.args.host, detailed=True):
+                if hypervisor.hypervisor_hostname == self.args.host:
+                    return hypervisor_metrics(*hypervisor_totals([hypervisor]))
+
+            raise ValueError(f"Hypervisor not found: {self.args.host}")
+
+        result = nova.hypervisors.statistics()
+
+        return hypervisor_metrics(
+            result.vcpus,
+            result.vcpus_used,
+            result.memory_mb,
+            result.memory_mb_used,
+            result.running_vms,
+        )
 
     @classmethod
     def setup(cls, options: _ArgumentGroup, parser: ArgumentParser):
@@ -128,6 +125,11 @@ class NovaHypervisors(osnag.Resource):
             default=None,
             help="hostname where the hypervisor is running if not defined (default), summary of all hosts is used",
         )
+        options.add_argument(
+            "--per-host",
+            action="store_true",
+            help="report metrics for every hypervisor in addition to the totals, using a single request",
+        )
         options.add_argument(
             "-w",
             "--warn",
@@ -192,6 +194,96 @@ class NovaHypervisors(osnag.Resource):
         )
 
 
+def list_hypervisors(nova) -> list:
+    """
+    Fetch all hypervisors with details, following the links to the next
+    page of the pagination applied by the API server.
+    """
+    from novaclient.v2.hypervisors import Hypervisor
+
+    hypervisors = []
+    url = "/os-hypervisors/detail"
+
+    # novaclient drops the links of the response, so request the raw
+    # pages. The last page has no link to a next one.
+    while url:
+        _, body = nova.client.get(url)
+        hypervisors.extend(
+            Hypervisor(nova.hypervisors, data, loaded=True)
+            for data in body["hypervisors"]
+        )
+        url = next(
+            (
+                link["href"]
+                for link in body.get("hypervisors_links", [])
+                if link.get("rel") == "next"
+            ),
+            None,
+        )
+
+    return hypervisors
+
+
+def hypervisor_totals(hypervisors) -> tuple[int, int, int, int, int]:
+    """
+    Sum up vcpus, vcpus_used, memory_mb, memory_mb_used and running_vms
+    of the given hypervisors.
+    """
+    return (
+        sum(h.vcpus for h in hypervisors),
+        sum(h.vcpus_used for h in hypervisors),
+        sum(h.memory_mb for h in hypervisors),
+        sum(h.memory_mb_used for h in hypervisors),
+        sum(h.running_vms for h in hypervisors),
+    )
+
+
+def hypervisor_metrics(
+    vcpus: int,
+    vcpus_used: int,
+    memory_mb: int,
+    memory_mb_used: int,
+    running_vms: int,
+    prefix: str = "",
+) -> list[Metric]:
+    return [
+        Metric(
+            f"{prefix}vcpus_used",
+            vcpus_used,
+            min=0,
+            max=vcpus,
+            context="vcpus_used",
+        ),
+        Metric(
+            f"{prefix}vcpus_percent",
+            100 * vcpus_used / vcpus if vcpus else 0,
+            min=0,
+            max=100,
+            context="vcpus_percent",
+        ),
+        Metric(
+            f"{prefix}memory_used",
+            memory_mb_used,
+            min=0,
+            max=memory_mb,
+            context="memory_used",
+        ),
+        Metric(
+            f"{prefix}memory_percent",
+            100 * memory_mb_used / memory_mb if memory_mb else 0,
+            min=0,
+            max=100,
+            context="memory_percent",
+        ),
+        Metric(
+            f"{prefix}running_vms",
+            running_vms,
+            min=0,
+            context="running_vms",
+        ),
+    ]
+
+
 def main():
     osnag.run_check(NovaHypervisors)
 
@@ -30,7 +30,6 @@ from argparse import ArgumentParser, Namespace, _ArgumentGroup
 from nagiosplugin.check import Check
 from nagiosplugin.context import ScalarContext
 from nagiosplugin.metric import Metric
-from novaclient.client import Client
 
 import openstacknagios.openstacknagios as osnag
 
@@ -48,33 +47,51 @@ class NovaServices(osnag.Resource):
             ScalarContext("disabled", args.warn_disabled, args.critical_disabled),
             ScalarContext("down", args.warn_down, args.critical_down),
             ScalarContext("total", "0:", "@0"),
+            ScalarContext("snapshot_age"),
             osnag.Summary(show=["up", "disabled", "down", "total"]),
         )
 
     def probe(self):
-        nova = Client("2.1", session=self.session)
-        result = nova.services.list(host=self.args.host, binary=self.args.binary)
-
-        services_up = 0
-        services_disabled = 0
-        services_down = 0
-        services_total = 0
-
-        for agent in result:
-            services_total += 1
-            if agent.status == "enabled" and agent.state == "up":
-                services_up += 1
-            elif agent.status == "disabled":
-                services_disabled += 1
-            else:
-                services_down += 1
-
-        return [
-            Metric("up", services_up, min=0),
-            Metric("disabled", services_disabled, min=0),
-            Metric("down", services_down, min=0),
-            Metric("total", services_total, min=0),
-        ]
+        from novaclient.client import Client
+
+        hosts = self.args.host
+
+        def fetch(host=None):
+            nova = Client("2.1", session=self.session)
+            result = nova.services.list(host=host, binary=self.args.binary)
+            return [service.to_dict() for service in result]
+
+        metrics = []
+
+        # A single host is filtered by the API, otherwise all services
+        # are fetched once and grouped by host. With a snapshot, all
+        # services are shared with the checks of other hosts.
+        if self.args.snapshot_ttl:
+            result, age = self.snapshot(
+                f"compute services {self.args.binary}", fetch, "host", hosts
+            )
+            metrics.append(Metric("snapshot_age", round(age, 1), uom="s", min=0))
+        elif hosts and len(hosts) == 1:
+            result = fetch(hosts[0])
+        else:
+            result = fetch()
+
+        metrics.extend(
+            osnag.service_metrics(
+                ((service["host"], self._state(service)) for service in result),
+                hosts=hosts,
+                per_host=self.args.per_host,
+            )
+        )
+        return metrics
+
+    @staticmethod
+    def _state(service) -> str:
+        if service["status"] == "enabled" and service["state"] == "up":
+            return "up"
+        if service["status"] == "disabled":
+            return "disabled"
+        return "down"
 
     @classmethod
     def setup(cls, options: _ArgumentGroup, parser: ArgumentParser):
@@ -125,9 +142,16 @@ class NovaServices(osnag.Resource):
         options.add_argument(
             "--host",
             dest="host",
+            action="append",
             default=None,
-            help="filter hostname",
+            help="filter hostname, can be given multiple times to check several hosts at once",
+        )
+        options.add_argument(
+            "--per-host",
+            action="store_true",
+            help="report metrics for each host in addition to the totals",
         )
+        osnag.snapshot_option(options)
 
 
 def main():
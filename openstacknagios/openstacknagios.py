@@ -18,21 +18,112 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import contextlib
+import json
+import logging
 import sys
+import time
 from argparse import ArgumentParser, Namespace, _ArgumentGroup
-from typing import Type
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Optional, Type
 
 import nagiosplugin
-import openstack
-import openstack.config.loader
-import openstack.connection
-from keystoneauth1.session import Session
-from nagiosplugin import Check
+from nagiosplugin import Check, Metric
 from nagiosplugin import Resource as NagiosResource
 from nagiosplugin import Summary as NagiosSummary
-from openstack.config.cloud_region import CloudRegion
 
-from openstacknagios import icinga
+from openstacknagios import cache, icinga
+
+# The OpenStack SDK and client libraries are only imported when actually
+# needed, i.e. when parsing arguments or connecting, to keep the startup
+# of checks cheap.
+if TYPE_CHECKING:
+    from keystoneauth1.session import Session
+    from openstack.config.cloud_region import CloudRegion
+    from openstack.connection import Connection
+
+_log = logging.getLogger("nagiosplugin")
+
+# Authorized connections, shared by all check resources running in this
+# process with the same cloud region configuration. All service clients
+# created from a connection's session share its HTTP connection pool, so
+# TCP and TLS connections are kept alive and reused between requests.
+_connections: dict[str, "Connection"] = {}
+
+# Number of kept-alive HTTP connections per host. Checks send up to
+# MAX_CONCURRENT_REQUESTS (8) requests in parallel from the thread pools
+# of check_gnocchi_measures and check_ceilometer_statistics, and one per
+# status with check_neutron_routers --per-status. Connections beyond the
+# pool size are closed after use, and opened again by the next probe in
+# the same process.
+HTTP_POOL_SIZE = 16
+
+# Options handled by the check's own argument parser alone, without the
+# OpenStack options.
+LIGHTWEIGHT_OPTIONS = {"-h", "--help", "--print-command-definition"}
+
+# Settings of the cloud region configuration identifying the cloud and
+# credentials. The configuration also holds the options of the check
+# itself, which must not keep checks from sharing connections.
+REGION_KEYS = (
+    "auth_type",
+    "auth",
+    "region_name",
+    "interface",
+    "verify",
+    "insecure",
+    "cacert",
+    "cert",
+    "key",
+    "api_timeout",
+    "timeout",
+)
+
+
+def region_key(region: "CloudRegion") -> str:
+    return json.dumps(
+        {key: region.config.get(key) for key in REGION_KEYS},
+        sort_keys=True,
+        default=str,
+    )
+
+
+def connect(region: "CloudRegion", args: Namespace) -> "Connection":
+    import openstack.connection
+    from requests.adapters import HTTPAdapter
+
+    key = region_key(region)
+
+    if key not in _connections:
+        connection = openstack.connection.Connection(config=region)
+
+        # Enlarge the pools of the adapters installed by keystoneauth,
+        # keeping their TCP keep-alive and TLS settings.
+        for adapter in connection.session.session.adapters.values():
+            if isinstance(adapter, HTTPAdapter):
+                adapter.init_poolmanager(HTTP_POOL_SIZE, HTTP_POOL_SIZE)
+
+        # Wrap the adapters to share responses with other checks.
+        if args.coalesce_window:
+            from openstacknagios.coalesce import CoalescingAdapter
+
+            http = connection.session.session
+            for prefix, adapter in list(http.adapters.items()):
+                http.mount(
+                    prefix,
+                    CoalescingAdapter(
+                        adapter, key, args.coalesce_window, args.runtime_dir
+                    ),
+                )
+
+        if args.token_cache:
+            with cache.TokenCache(region.get_auth(), args.runtime_dir):
+                connection.authorize()
+        else:
+            connection.authorize()
+
+        _connections[key] = connection
+
+    return _connections[key]
 
 
 class Resource(NagiosResource):
@@ -40,7 +131,7 @@ class Resource(NagiosResource):
     OpenStack Check Resource
     """
 
-    def __init__(self, check: Check, args: Namespace, region: CloudRegion) -> None:
+    def __init__(self, check: Check, args: Namespace, region: "CloudRegion") -> None:
         super().__init__()
 
         self.args = args
@@ -48,10 +139,69 @@ class Resource(NagiosResource):
         self.configure(check, args)
 
     @property
-    def session(self) -> Session:
-        connection = openstack.connection.Connection(config=self.region)
-        connection.authorize()
-        return connection.session
+    def session(self) -> "Session":
+        return connect(self.region, self.args).session
+
+    def snapshot(
+        self,
+        name: str,
+        fetch: Callable[[], Iterable[dict[str, Any]]],
+        index: str,
+        keys: Optional[list[str]] = None,
+    ) -> tuple[list[dict[str, Any]], float]:
+        """
+        Return the records returned by `fetch` with their `index` field in
+        `keys` (all records if no keys are given), and their age in
+        seconds.
+
+        The records are kept in a local snapshot for --snapshot-ttl
+        seconds, shared by all checks of the same cloud region using the
+        same `name`, which has to identify the service and query of
+        `fetch`. While the snapshot is fresh, the records are looked up
+        there instead of calling `fetch`, e.g. when checking each host
+        separately. Only one check at a time refreshes an expired
+        snapshot, while the others wait and then read the new snapshot.
+        """
+        key = cache.cache_key(region_key(self.region), name)
+        ttl = self.args.snapshot_ttl
+
+        def load() -> Optional[dict]:
+            try:
+                return cache.load_snapshot(key, ttl, self.args.runtime_dir)
+            except (OSError, ValueError, KeyError) as err:
+                _log.warning("Cannot read snapshot: %s", err)
+                return None
+
+        snapshot = load()
+
+        with contextlib.ExitStack() as stack:
+            if snapshot is None:
+                try:
+                    stack.enter_context(cache.snapshot_lock(key, self.args.runtime_dir))
+                except OSError as err:
+                    _log.warning("Cannot lock snapshot: %s", err)
+                else:
+                    # Another check may have refreshed it while waiting.
+                    snapshot = load()
+
+            if snapshot is None:
+                records: dict[str, list[dict[str, Any]]] = {}
+                for record in fetch():
+                    records.setdefault(str(record[index]), []).append(record)
+
+                snapshot = {"time": time.time(), "records": records}
+                try:
+                    cache.store_snapshot(key, snapshot, self.args.runtime_dir)
+                except (OSError, TypeError) as err:
+                    _log.warning("Cannot store snapshot: %s", err)
+
+        records = snapshot["records"]
+        if keys is None:
+            selected = [record for group in records.values() for record in group]
+        else:
+            selected = [record for key in keys for record in records.get(key, [])]
+
+        return selected, max(0.0, time.time() - snapshot["time"])
 
     def configure(self, check: Check, args: Namespace):
         """
@@ -108,21 +258,88 @@ class Summary(NagiosSummary):
         self.show = show
 
     def ok(self, results):
-        return "[" + " ".join(r + ":" + str(results[r].metric) for r in self.show) + "]"
+        return "[" + self._metrics(results) + "]"
 
     def problem(self, results):
-        return (
-            str(results.first_significant)
-            + "["
-            + " ".join(r + ":" + str(results[r].metric) for r in self.show)
-            + "]"
+        return str(results.first_significant) + "[" + self._metrics(results) + "]"
+
+    def _metrics(self, results):
+        # Metrics may be missing, e.g. if there is no data to derive
+        # them from.
+        return " ".join(
+            r + ":" + str(results[r].metric) for r in self.show if r in results
         )
 
 
+def snapshot_option(options: _ArgumentGroup):
+    """Add the --snapshot-ttl option for checks using `Resource.snapshot`."""
+    options.add_argument(
+        "--snapshot-ttl",
+        metavar="SECONDS",
+        type=int,
+        default=0,
+        help="share the API response with other checks of this cloud for SECONDS, e.g. when checking hosts separately (default: 0, disabled)",
+    )
+
+
+def service_metrics(
+    services: Iterable[tuple[str, str]],
+    hosts: Optional[list[str]] = None,
+    per_host: bool = False,
+) -> list[Metric]:
+    """
+    Count service or agent states and return "up", "disabled", "down"
+    and "total" metrics.
+
+    `services` yields (host, state) tuples with state being one of "up",
+    "disabled" or "down". If `hosts` are given, only services on these
+    hosts are counted. With `per_host` or more than one host given,
+    metrics are added for each host, named e.g. "compute1_down" and
+    evaluated with the same contexts as the totals.
+    """
+    names = ("up", "disabled", "down", "total")
+    totals = dict.fromkeys(names, 0)
+    by_host = {host: dict.fromkeys(names, 0) for host in hosts or []}
+
+    for host, state in services:
+        if hosts and host not in hosts:
+            continue
+
+        for counts in (totals, by_host.setdefault(host, dict.fromkeys(names, 0))):
+            counts[state] += 1
+            counts["total"] += 1
+
+    metrics = [Metric(name, value, min=0) for name, value in totals.items()]
+
+    if per_host or len(hosts or []) > 1:
+        for host, counts in sorted(by_host.items()):
+            metrics.extend(
+                Metric(f"{host}_{name}", value, min=0, context=name)
+                for name, value in counts.items()
+            )
+
+    return metrics
+
+
 @nagiosplugin.guarded
 def run_check(resource_class: Type[Resource]):
+    check, args = create_check(resource_class)
+    check.main(verbose=args.verbose, timeout=args.check_timeout)
+
+
+def create_parser(resource_class: Type[Resource]) -> ArgumentParser:
+    """
+    Return an argument parser with the global and check options of the
+    given check resource, without the OpenStack options.
+    """
     parser = ArgumentParser(description=resource_class.__doc__)
 
+    parser.add_argument(
+        "--help-all",
+        action="help",
+        help="show this help message including the OpenStack options and exit",
+    )
+
     parser.add_argument(
         "--print-command-definition",
         action=icinga.command_definition_action(resource_class),
@@ -145,9 +362,59 @@ def run_check(resource_class: Type[Resource]):
         help="Increase output verbosity",
     )
 
+    options.add_argument(
+        "--runtime-dir",
+        metavar="DIR",
+        default=None,
+        help="Private directory for state shared between checks, e.g. cached tokens (default: openstacknagios below XDG_RUNTIME_DIR)",
+    )
+
+    options.add_argument(
+        "--no-token-cache",
+        dest="token_cache",
+        action="store_false",
+        help="Always authenticate instead of reusing a cached Keystone token",
+    )
+
+    options.add_argument(
+        "--coalesce-window",
+        metavar="SECONDS",
+        type=float,
+        default=0,
+        help="Reuse the response to an identical GET request of another check for SECONDS instead of sending it again (default: 0, disabled)",
+    )
+
     # Allow resources to add custom options to the argument parser.
     resource_class.setup(options, parser)
 
+    return parser
+
+
+def create_check(
+    resource_class: Type[Resource], argv: Optional[list[str]] = None
+) -> tuple[Check, Namespace]:
+    """
+    Parse the command line arguments `argv` (default: `sys.argv`) for the
+    given check resource, and return a check object with the resource
+    added, ready to be executed.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+
+    parser = create_parser(resource_class)
+
+    # Help and command definitions only need the check's own options.
+    # Handle them before registering the OpenStack options, which imports
+    # the OpenStack SDK and takes most of the startup time.
+    if LIGHTWEIGHT_OPTIONS.intersection(argv) and "--help-all" not in argv:
+        parser.epilog = (
+            "OpenStack connection and authentication options are omitted, "
+            "use --help-all to show them."
+        )
+        parser.parse_known_args(argv)
+
+    import openstack.config.loader
+
     # Set up OpenStack connection session and load config using
     # OpenStacks config framework.
     #
@@ -162,10 +429,10 @@ def run_check(resource_class: Type[Resource]):
     )
 
     # Add OpenStack arguments to our parser
-    config.register_argparse_arguments(parser, sys.argv)
+    config.register_argparse_arguments(parser, argv)
 
     # Finally parse all arguments
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     # Load region configuration
     #
@@ -176,4 +443,5 @@ def run_check(resource_class: Type[Resource]):
     check = Check()
     resource = resource_class(check, args, region)
     check.add(resource)
-    check.main(verbose=args.verbose, timeout=args.check_timeout)
+
+    return check, args
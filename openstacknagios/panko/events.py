@@ -20,6 +20,10 @@
 
 """
 Nagios plugin to check panko events
+
+Besides the total time, the time to obtain a token and the time spent
+in each phase of the HTTP requests (DNS lookup, TCP connect, TLS
+handshake, time to first byte and reading the body) are reported.
 """
 
 import time
@@ -28,7 +32,6 @@ from argparse import ArgumentParser, Namespace, _ArgumentGroup
 from nagiosplugin.check import Check
 from nagiosplugin.context import ScalarContext
 from nagiosplugin.metric import Metric
-from pankoclient.v2.client import Client
 
 import openstacknagios.openstacknagios as osnag
 
@@ -43,18 +46,31 @@ class PankoEvents(osnag.Resource):
 
         check.add(
             ScalarContext("gettime", args.warn, args.critical),
+            ScalarContext("phase"),
             osnag.Summary(show=["gettime"]),
         )
 
     def probe(self):
+        from pankoclient.v2.client import Client
+
+        from openstacknagios.timing import RequestTimer
+
         start = time.time()
 
-        panko = Client(session=self.session)
-        # print panko.event.list()
+        session = self.session
+        auth_time = time.time() - start
+
+        panko = Client(session=session)
+        with RequestTimer(session) as timer:
+            panko.event.list(limit=1)
 
         get_time = time.time()
 
-        return Metric("gettime", get_time - start, min=0)
+        return [
+            Metric("gettime", get_time - start, min=0),
+            Metric("auth", round(auth_time, 6), uom="s", min=0, context="phase"),
+            *timer.metrics(),
+        ]
 
     @classmethod
     def setup(cls, options: _ArgumentGroup, parser: ArgumentParser):
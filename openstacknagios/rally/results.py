@@ -24,36 +24,189 @@ Nagios/Icinga plugin to check rally results
 
 Takes the output of 'rally task results' as input on stdin. and
 calculates the sum of load- and full_duration and the number of failed
-scenarios.
+scenarios. For every scenario and atomic action, the 50th, 95th and
+99th percentiles of the iteration durations are reported as well.
+
+The results are parsed incrementally, one task result at a time, so
+large result files do not need to fit into memory. With --resultglob,
+a set of result files is memory-mapped and parsed by a pool of worker
+processes, and the results of all files are merged.
+
+With --incremental, the byte offset of the last parsed task result and
+the aggregates so far are kept in a state file. Subsequent runs only
+parse task results appended to --resultfile since, and report them
+along with the cumulative aggregates.
 """
 
+import codecs
+import glob
+import hashlib
 import json
+import logging
+import math
+import mmap
+import multiprocessing
+import os
 import sys
+import time
 from argparse import ArgumentParser, Namespace, _ArgumentGroup
+from typing import IO, Any, Iterable, Iterator, Optional
 
 from nagiosplugin.check import Check
 from nagiosplugin.context import ScalarContext
 from nagiosplugin.metric import Metric
-from openstack.config.cloud_region import CloudRegion
 
 import openstacknagios.openstacknagios as osnag
+from openstacknagios import cache
 
+_log = logging.getLogger("nagiosplugin")
 
-class RallyResults(osnag.Resource):
-    def __init__(self, check: Check, args: Namespace, region: CloudRegion) -> None:
-        super().__init__(check, args, region)
+# Number of characters read at once from the result file.
+CHUNK_SIZE = 64 * 1024
 
-        if args.resultfile:
-            infile = open(args.resultfile, "r", encoding="utf-8")
+# Number of bytes before the stored offset used to recognize a result
+# file that has been replaced rather than appended to.
+FINGERPRINT_SIZE = 4096
 
-            with infile:
-                try:
-                    self.results = json.load(infile)
-                except ValueError as err:
-                    raise SystemExit(sys.exc_info()[1]) from err
+# Counters of a summary, which are summed up when merging summaries.
+COUNTERS = ("total", "errors", "slafail", "fulldur", "loaddur")
+
+# Percentiles of the iteration durations reported per scenario and
+# atomic action.
+PERCENTILES = (50, 95, 99)
+
+
+def iter_json_array(infile: IO[str], chunk_size: int = CHUNK_SIZE) -> Iterator[Any]:
+    """
+    Incrementally decode the elements of the top-level JSON array in
+    `infile`.
+
+    Only one element is kept in memory at a time, so memory usage is
+    bounded by the largest element rather than the size of the file.
+    """
+    for element, _ in iter_json_records(infile, chunk_size):
+        yield element
+
+
+def iter_json_records(
+    infile: IO[str], chunk_size: int = CHUNK_SIZE, continued: bool = False
+) -> Iterator[tuple[Any, int]]:
+    """
+    Like `iter_json_array`, but yield every element together with the
+    number of UTF-8 encoded bytes consumed from `infile` up to the end
+    of the element.
+
+    With `continued`, `infile` is expected to be positioned right after
+    an element of the array instead of at its beginning, e.g. at an
+    offset returned before.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    consumed = 0
+    eof = False
+
+    def fill(size: int) -> bool:
+        nonlocal buffer, eof
+        chunk = infile.read(size)
+        if not chunk:
+            eof = True
+        buffer += chunk
+        return bool(chunk)
+
+    def skip(count: int) -> None:
+        # Only used for JSON whitespace and structural characters,
+        # which are single bytes in UTF-8.
+        nonlocal buffer, consumed
+        buffer = buffer[count:]
+        consumed += count
+
+    def skip_whitespace() -> None:
+        skip(len(buffer) - len(buffer.lstrip()))
+        while not buffer and fill(chunk_size):
+            skip(len(buffer) - len(buffer.lstrip()))
+
+    if not continued:
+        skip_whitespace()
+        if not buffer.startswith("["):
+            raise ValueError("Expecting JSON array of rally task results")
+        skip(1)
+
+    while True:
+        skip_whitespace()
+        if not buffer:
+            raise ValueError("Unterminated JSON array")
+        if buffer[0] == "]":
+            return
+        if buffer[0] == ",":
+            skip(1)
+            continue
+
+        while True:
+            try:
+                element, end = decoder.raw_decode(buffer)
+                # Numbers and literals could continue in the next chunk.
+                if end < len(buffer) or eof:
+                    break
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+
+            # Grow the read size with the element size, so decoding a
+            # large element is not quadratic in the number of chunks.
+            fill(max(chunk_size, len(buffer)))
+
+        consumed += len(buffer[:end].encode("utf-8"))
+        buffer = buffer[end:]
+        yield element, consumed
+
+
+class DurationHistogram:
+    """
+    Histogram of durations with logarithmic buckets.
+
+    Memory usage is constant regardless of the number of durations
+    added, and quantiles are accurate within the bucket growth factor.
+    Histograms can be merged, e.g. from different result files.
+    """
+
+    # Durations below MINIMUM seconds share the first bucket, every
+    # further bucket is GROWTH times wider than the previous one.
+    MINIMUM = 0.001
+    GROWTH = 1.02
+
+    def __init__(self) -> None:
+        self.buckets: dict[int, int] = {}
+        self.count = 0
+        self.maximum = 0.0
+
+    def add(self, duration: float) -> None:
+        if duration > self.MINIMUM:
+            index = math.ceil(math.log(duration / self.MINIMUM, self.GROWTH))
         else:
-            self.results = json.load(sys.stdin)
+            index = 0
 
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.maximum = max(self.maximum, duration)
+
+    def merge(self, other: "DurationHistogram") -> None:
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.maximum = max(self.maximum, other.maximum)
+
+    def quantile(self, q: float) -> float:
+        """Return the upper bound of the bucket containing quantile `q`."""
+        rank = q * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(self.MINIMUM * self.GROWTH**index, self.maximum)
+        return self.maximum
+
+
+class RallyResults(osnag.Resource):
     def configure(self, check: Check, args: Namespace):
         super().configure(check, args)
 
@@ -63,35 +216,161 @@ class RallyResults(osnag.Resource):
             ScalarContext("slafail", args.warn_slafail, args.critical_slafail),
             ScalarContext("fulldur", args.warn_fulldur, args.critical_fulldur),
             ScalarContext("loaddur", args.warn_loaddur, args.critical_loaddur),
+            ScalarContext("p50", args.warn_p50, args.critical_p50),
+            ScalarContext("p95", args.warn_p95, args.critical_p95),
+            ScalarContext("p99", args.warn_p99, args.critical_p99),
+            ScalarContext("files"),
+            ScalarContext("cumulative"),
+            ScalarContext("skipped", args.warn_skipped, args.critical_skipped),
             osnag.Summary(show=["errors", "slafail"]),
         )
 
     def probe(self):
-        full_duration = 0
-        load_duration = 0
-        total = 0
-        errors = 0
-        slafail = 0
-        for res in self.results:
-            total = total + 1
-            full_duration = full_duration + res["full_duration"]
-            load_duration = load_duration + res["load_duration"]
-            for runres in res["result"]:
-                if runres["error"] != []:
-                    errors = errors + 1
-
-            if "sla" in res:
-                for sla in res["sla"]:
-                    if not sla["success"]:
-                        slafail = slafail + 1
-
-        return [
-            Metric("total", total),
-            Metric("errors", errors),
-            Metric("slafail", slafail),
-            Metric("fulldur", full_duration, uom="s"),
-            Metric("loaddur", load_duration, uom="s"),
-        ]
+        metrics = []
+
+        if self.args.resultglob:
+            totals, files, skipped = self._summarize_files()
+            metrics.append(Metric("files", files, min=0))
+            metrics.append(Metric("skipped", skipped, min=0))
+        elif self.args.incremental:
+            totals, cumulative = self._summarize_incremental()
+            for key in ("total", "errors", "slafail"):
+                metrics.append(
+                    Metric(f"cumulative_{key}", cumulative[key], context="cumulative")
+                )
+            for key in ("fulldur", "loaddur"):
+                metrics.append(
+                    Metric(
+                        f"cumulative_{key}",
+                        cumulative[key],
+                        uom="s",
+                        context="cumulative",
+                    )
+                )
+        elif self.args.resultfile:
+            with open(self.args.resultfile, "r", encoding="utf-8") as infile:
+                totals = summarize(iter_json_array(infile))
+        else:
+            totals = summarize(iter_json_array(sys.stdin))
+
+        metrics.extend(
+            [
+                Metric("total", totals["total"]),
+                Metric("errors", totals["errors"]),
+                Metric("slafail", totals["slafail"]),
+                Metric("fulldur", totals["fulldur"], uom="s"),
+                Metric("loaddur", totals["loaddur"], uom="s"),
+            ]
+        )
+
+        for name, histogram in sorted(totals["durations"].items()):
+            for percentile in PERCENTILES:
+                metrics.append(
+                    Metric(
+                        f"{name}_p{percentile}",
+                        histogram.quantile(percentile / 100),
+                        uom="s",
+                        min=0,
+                        context=f"p{percentile}",
+                    )
+                )
+
+        return metrics
+
+    def _summarize_files(self) -> tuple[dict[str, Any], int, int]:
+        """
+        Summarize the newest result files matching --resultglob in
+        parallel. Files not parsed before the deadline, which leaves some
+        headroom to --check-timeout, are skipped.
+        """
+        deadline = time.monotonic() + 0.8 * self.args.check_timeout
+
+        paths = sorted(glob.glob(self.args.resultglob), key=os.path.getmtime)
+        if self.args.last:
+            paths = paths[-self.args.last :]
+
+        totals = summarize([])
+        files = 0
+
+        with multiprocessing.Pool(self.args.workers) as pool:
+            results = pool.imap_unordered(summarize_file, paths)
+
+            for _ in paths:
+                try:
+                    path, result = results.next(
+                        timeout=max(0, deadline - time.monotonic())
+                    )
+                except multiprocessing.TimeoutError:
+                    _log.warning("Deadline reached, skipping remaining files")
+                    break
+
+                if result is None:
+                    _log.warning("Cannot parse %s", path)
+                    continue
+
+                merge(totals, result)
+                files += 1
+
+            # Leaving the pool context terminates workers still running.
+
+        return totals, files, len(paths) - files
+
+    def _summarize_incremental(self) -> tuple[dict[str, Any], dict[str, Any]]:
+        """
+        Summarize the task results appended to --resultfile since the
+        last run, and return them along with the cumulative counters.
+
+        A trailing task result that is still being written is left for
+        the next run.
+        """
+        if not self.args.resultfile:
+            raise ValueError("--incremental requires --resultfile")
+
+        statefile = self.args.state_file or os.path.join(
+            cache.runtime_dir(self.args.runtime_dir),
+            f"rally-{cache.cache_key(os.path.abspath(self.args.resultfile))}.json",
+        )
+
+        with (
+            cache.locked_file(statefile) as state,
+            open(self.args.resultfile, "rb") as infile,
+        ):
+            cursor = load_cursor(state, infile)
+
+            offset = 0
+            cumulative = summarize([])
+            if cursor is not None:
+                offset = cursor["offset"]
+                cumulative.update(cursor["totals"])
+
+            infile.seek(offset)
+            reader = codecs.getreader("utf-8")(infile)
+            position = offset
+
+            def records() -> Iterator[dict[str, Any]]:
+                nonlocal position
+                try:
+                    for element, consumed in iter_json_records(
+                        reader, continued=cursor is not None
+                    ):
+                        yield element
+                        # Only advance once the element has been summarized.
+                        position = offset + consumed
+                except ValueError as err:
+                    _log.info("Incomplete task result after byte %d: %s", position, err)
+
+            totals = summarize(records())
+            merge(cumulative, totals)
+
+            # A cursor is only valid right after an element. Until the
+            # first one is complete, parse the file from the beginning.
+            if position > 0:
+                store_cursor(state, infile, position, cumulative)
+            else:
+                state.seek(0)
+                state.truncate()
+
+        return totals, cumulative
 
     @classmethod
     def setup(cls, options: _ArgumentGroup, parser: ArgumentParser):
@@ -101,6 +380,47 @@ class RallyResults(osnag.Resource):
             "--resultfile",
             help="file to read results from (output of rally task results) if not specified, stdin is used.",
         )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="only parse task results appended to --resultfile since the last run, and report cumulative metrics in addition",
+        )
+        parser.add_argument(
+            "--state-file",
+            metavar="PATH",
+            help="with --incremental, file to keep the offset and aggregates in (default: in the runtime directory)",
+        )
+        parser.add_argument(
+            "--resultglob",
+            metavar="PATTERN",
+            help="read and merge results from all files matching PATTERN, e.g. '/var/lib/rally/results/*.json'",
+        )
+        parser.add_argument(
+            "--last",
+            metavar="N",
+            type=int,
+            default=0,
+            help="with --resultglob, only read the N most recently modified files (default: 0, all files)",
+        )
+        parser.add_argument(
+            "--workers",
+            metavar="N",
+            type=int,
+            default=None,
+            help="with --resultglob, number of worker processes parsing files (default: number of CPUs)",
+        )
+        parser.add_argument(
+            "--warn-skipped",
+            metavar="RANGE",
+            default="0",
+            help="return warning if number of result files not parsed in time or unreadable is outside RANGE (default: 0, warn if any)",
+        )
+        parser.add_argument(
+            "--critical-skipped",
+            metavar="RANGE",
+            default="0:",
+            help="return critical if number of result files not parsed in time or unreadable is outside RANGE (default: 0:, never critical)",
+        )
 
         parser.add_argument(
             "-w",
@@ -143,6 +463,20 @@ class RallyResults(osnag.Resource):
             help="return critical if number of sla failures is outside RANGE (default: :0, critical if any failures)",
         )
 
+        for percentile in PERCENTILES:
+            parser.add_argument(
+                f"--warn-p{percentile}",
+                metavar="RANGE",
+                default="0:",
+                help=f"return warning if the {percentile}th percentile of the iteration duration of any scenario or atomic action is outside RANGE (default: 0:, never warn)",
+            )
+            parser.add_argument(
+                f"--critical-p{percentile}",
+                metavar="RANGE",
+                default="0:",
+                help=f"return critical if the {percentile}th percentile of the iteration duration of any scenario or atomic action is outside RANGE (default: 0:, never critical)",
+            )
+
         parser.add_argument(
             "--warn_fulldur",
             metavar="RANGE",
@@ -170,6 +504,138 @@ class RallyResults(osnag.Resource):
         )
 
 
+def summarize(results: Iterable[dict[str, Any]]) -> dict[str, Any]:
+    """
+    Count scenarios, failed iterations and SLA failures, sum up the full
+    and load durations, and collect iteration durations per scenario and
+    atomic action (as `scenario/action`) of the given rally task results.
+    """
+    totals = {
+        "total": 0,
+        "errors": 0,
+        "slafail": 0,
+        "fulldur": 0,
+        "loaddur": 0,
+        "durations": {},
+    }
+
+    for res in results:
+        totals["total"] += 1
+        totals["fulldur"] += res["full_duration"]
+        totals["loaddur"] += res["load_duration"]
+
+        name = res.get("key", {}).get("name", "unknown")
+        durations = totals["durations"]
+        histogram = durations.setdefault(name, DurationHistogram())
+
+        for runres in res["result"]:
+            if runres["error"] != []:
+                totals["errors"] += 1
+            if "duration" in runres:
+                histogram.add(runres["duration"])
+
+            for action, duration in atomic_durations(runres.get("atomic_actions")):
+                key = f"{name}/{action}"
+                durations.setdefault(key, DurationHistogram()).add(duration)
+
+        for sla in res.get("sla", []):
+            if not sla["success"]:
+                totals["slafail"] += 1
+
+    return totals
+
+
+def atomic_durations(actions: Any) -> Iterator[tuple[str, float]]:
+    """
+    Yield name and duration of the atomic actions of an iteration.
+
+    Older rally versions report atomic actions as a mapping of names to
+    durations, newer ones as a list of actions with start and finish
+    timestamps. Actions that did not finish are skipped.
+    """
+    if isinstance(actions, dict):
+        for action, duration in actions.items():
+            if duration is not None:
+                yield action, duration
+        return
+
+    for action in actions or []:
+        if action.get("finished_at") is not None:
+            yield action["name"], action["finished_at"] - action["started_at"]
+
+
+def summarize_file(path: str) -> tuple[str, Optional[dict[str, Any]]]:
+    """
+    Summarize a memory-mapped result file. Returns None as summary if
+    the file cannot be read or parsed.
+    """
+    try:
+        with open(path, "rb") as infile:
+            with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                reader = codecs.getreader("utf-8")(mapped)
+                return path, summarize(iter_json_array(reader))
+    except (OSError, ValueError, KeyError, TypeError):
+        return path, None
+
+
+def fingerprint(infile: IO[bytes], offset: int) -> str:
+    """Hash the bytes preceding `offset` in `infile`."""
+    start = max(0, offset - FINGERPRINT_SIZE)
+    infile.seek(start)
+    return hashlib.sha256(infile.read(offset - start)).hexdigest()
+
+
+def load_cursor(state: IO[str], infile: IO[bytes]) -> Optional[dict[str, Any]]:
+    """
+    Load the cursor from `state` if it still applies to the result file,
+    i.e. the file has only been appended to since the cursor was stored.
+    """
+    content = state.read()
+    if not content:
+        return None
+
+    try:
+        cursor = json.loads(content)
+        stat = os.fstat(infile.fileno())
+        if (
+            cursor["inode"] == [stat.st_dev, stat.st_ino]
+            and cursor["offset"] <= stat.st_size
+            and cursor["fingerprint"] == fingerprint(infile, cursor["offset"])
+        ):
+            return cursor
+    except (ValueError, KeyError, TypeError) as err:
+        _log.warning("Ignoring invalid state file: %s", err)
+        return None
+
+    _log.info("Result file has been replaced, starting over")
+    return None
+
+
+def store_cursor(
+    state: IO[str], infile: IO[bytes], offset: int, totals: dict[str, Any]
+) -> None:
+    stat = os.fstat(infile.fileno())
+    cursor = {
+        "inode": [stat.st_dev, stat.st_ino],
+        "offset": offset,
+        "fingerprint": fingerprint(infile, offset),
+        "totals": {key: totals[key] for key in COUNTERS},
+    }
+
+    state.seek(0)
+    state.truncate()
+    json.dump(cursor, state)
+    state.flush()
+
+
+def merge(totals: dict[str, Any], other: dict[str, Any]) -> None:
+    for key in COUNTERS:
+        totals[key] += other[key]
+
+    for name, histogram in other["durations"].items():
+        totals["durations"].setdefault(name, DurationHistogram()).merge(histogram)
+
+
 def main():
     osnag.run_check(RallyResults)
 
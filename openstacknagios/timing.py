@@ -0,0 +1,183 @@
+# pylint: disable=missing-docstring
+
+#
+#    Copyright (C) 2024  HPI  https://hpi.de
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Per-phase timing of HTTP requests
+
+Measures the phases of the HTTP requests made through a keystoneauth
+session while the timer is active:
+
+    dns      resolving the host name
+    connect  establishing the TCP connection
+    tls      the TLS handshake
+    ttfb     sending the request and waiting for the response headers
+    body     reading the response body
+
+    with RequestTimer(session) as timer:
+        glance.images.list(limit=1)
+
+    timer.total("ttfb")
+
+Requests made within the context always use new connections, so
+connection setup is measured on every run.
+"""
+
+import socket
+import time
+from typing import TYPE_CHECKING, Any
+
+from nagiosplugin.metric import Metric
+from requests.adapters import HTTPAdapter
+
+if TYPE_CHECKING:
+    from keystoneauth1.session import Session
+
+PHASES = ("dns", "connect", "tls", "ttfb", "body")
+
+
+class RequestTimer:
+    """
+    Record the phases of all requests sent through `session` while the
+    context is active, by temporarily mounting a timing transport
+    adapter on it.
+    """
+
+    def __init__(self, session: "Session") -> None:
+        self.session = session
+        self.requests: list[dict[str, Any]] = []
+        self._adapter = TimingAdapter(self)
+        self._adapters = None
+
+    def __enter__(self) -> "RequestTimer":
+        http = self.session.session
+        self._adapters = http.adapters.copy()
+        http.mount("https://", self._adapter)
+        http.mount("http://", self._adapter)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        http = self.session.session
+        http.adapters.clear()
+        http.adapters.update(self._adapters)
+        self._adapter.close()
+
+    @property
+    def current(self) -> dict[str, Any]:
+        return self.requests[-1]
+
+    def start(self, method: str, url: str) -> dict[str, Any]:
+        self.requests.append({"method": method, "url": url, **dict.fromkeys(PHASES, 0)})
+        return self.current
+
+    def total(self, phase: str) -> float:
+        return sum(request[phase] for request in self.requests)
+
+    def metrics(self, context: str = "phase") -> list[Metric]:
+        """Return the duration of every phase summed over all requests."""
+        return [
+            Metric(phase, round(self.total(phase), 6), uom="s", min=0, context=context)
+            for phase in PHASES
+        ]
+
+
+class TimedConnectionMixin:
+    """
+    Mixin for urllib3 connection classes recording the time to resolve
+    the host name, connect and establish TLS in the current request of
+    `timer`.
+    """
+
+    timer: RequestTimer
+
+    def _new_conn(self):
+        host = self._dns_host
+        start = time.perf_counter()
+
+        try:
+            address = socket.getaddrinfo(host, self.port, 0, socket.SOCK_STREAM)
+            self._dns_host = address[0][4][0]
+        except OSError:
+            # Let urllib3 report the error.
+            pass
+
+        resolved = time.perf_counter()
+        try:
+            sock = super()._new_conn()
+        finally:
+            self._dns_host = host
+
+        self.timer.current["dns"] += resolved - start
+        self.timer.current["connect"] += time.perf_counter() - resolved
+        return sock
+
+    def connect(self):
+        current = self.timer.current
+        before = current["dns"] + current["connect"]
+        start = time.perf_counter()
+
+        super().connect()
+
+        # connect() includes the TCP connection, anything else is TLS.
+        elapsed = time.perf_counter() - start
+        current["tls"] += max(
+            0, elapsed - (current["dns"] + current["connect"] - before)
+        )
+
+
+class TimingAdapter(HTTPAdapter):
+    """
+    Transport adapter recording the phases of every request in `timer`.
+    """
+
+    def __init__(self, timer: RequestTimer) -> None:
+        self.timer = timer
+        super().__init__()
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+
+        pool_classes = {}
+        for scheme, pool_cls in self.poolmanager.pool_classes_by_scheme.items():
+            connection_cls = type(
+                pool_cls.ConnectionCls.__name__,
+                (TimedConnectionMixin, pool_cls.ConnectionCls),
+                {"timer": self.timer},
+            )
+            pool_classes[scheme] = type(
+                pool_cls.__name__, (pool_cls,), {"ConnectionCls": connection_cls}
+            )
+
+        self.poolmanager.pool_classes_by_scheme = pool_classes
+
+    def send(self, request, stream=False, **kwargs):
+        timing = self.timer.start(request.method, request.url)
+        start = time.perf_counter()
+
+        response = super().send(request, stream=stream, **kwargs)
+        headers = time.perf_counter()
+
+        if not stream:
+            # Read the body here rather than in requests.Session, which
+            # caches it.
+            _ = response.content
+
+        setup = timing["dns"] + timing["connect"] + timing["tls"]
+        timing["ttfb"] = max(0, headers - start - setup)
+        timing["body"] = time.perf_counter() - headers
+        return response